@@ -1,40 +1,63 @@
 import os
+import io
+import csv
 import secrets
-import json
+import time
 from datetime import datetime, date as date_type, time as time_type
 from enum import Enum
 from typing import Optional, List
 
-import bcrypt
 import jwt
 from dotenv import load_dotenv
-from fastapi import FastAPI, HTTPException, Request, Query, Header, Depends, Body
-from fastapi.responses import JSONResponse, RedirectResponse, FileResponse, HTMLResponse
-from fastapi.staticfiles import StaticFiles
+from fastapi import FastAPI, HTTPException, Request, Query, Header, Depends, Body, BackgroundTasks
+from fastapi.responses import JSONResponse, RedirectResponse, FileResponse, HTMLResponse, StreamingResponse, PlainTextResponse
 from fastapi.templating import Jinja2Templates
 from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
 from starlette.middleware.sessions import SessionMiddleware
 
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session, joinedload
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from slowapi import Limiter
-from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
 from slowapi.middleware import SlowAPIMiddleware
 
 from pydantic import BaseModel, validator, EmailStr, conint
 
-from db import SessionLocal, engine, Base, get_db
-from models import User, Restaurant, Booking, BookingStatus, ContactMessage
+from db import SessionLocal, engine, Base, get_db, get_async_db, pool_stats
+from models import User, Restaurant, Booking, BookingStatus, ContactMessage, StripeEvent
 from fastapi import Request, Depends
 from emails import send_welcome_email, send_booking_confirmation, send_booking_cancellation
-from fuzzywuzzy import fuzz
+from capacity import (
+    ledger, slot_date, HELD_STATUSES, held_people_query, restaurant_lock_query, needs_write_lock, restaurant_write_lock
+)
+from mailer import start_worker, stop_worker
+from passwords import hash_password_async, verify_password_async, needs_rehash
+from payments import (
+    create_booking_checkout_async, expire_checkout_session_async, retrieve_checkout_session,
+    checkout_session_id, refund_checkout_session
+)
+from cache import TTLCache
+from ratelimit import limiter, LOGIN_LIMIT, REGISTER_LIMIT, BOOKING_LIMIT, AVAILABILITY_LIMIT
+from search import search_index
+from assets import PrecompressedStaticFiles, asset_url
+from conditional import (
+    etag, content_etag, if_none_match, not_modified_since, not_modified, validators
+)
+from i18n import SUPPORTED_LANGS, catalog, session_lang, page_lang, i18n_bundle
+from serializers import (
+    dumps, json_response, ok_response,
+    restaurant_serializer, user_booking_serializer, admin_booking_serializer
+)
 from datetime import date
 from sqlalchemy import func, and_, or_
 import stripe
 from datetime import datetime, timedelta
 from apscheduler.schedulers.background import BackgroundScheduler
+from expiry import sweep_expired_bookings, hold_timer, last_sweep, SWEEP_INTERVAL_SECONDS, SWEEP_BACKSTOP_SECONDS
+import metrics
 
 
 
@@ -53,10 +76,6 @@ stripe.api_key = STRIPE_SECRET_KEY
 # تحميل المتغيرات من ملف .env
 load_dotenv()
 
-# إنشاء Limiter
-limiter = Limiter(key_func=get_remote_address)
-
-
 # إنشاء التطبيق
 app = FastAPI()
 # مفتاح سري لتشفير بيانات الجلسة (غيره لمفتاح قوي)
@@ -75,10 +94,13 @@ app.add_middleware(
 )
 
 
-app.mount("/static", StaticFiles(directory="static"), name="static")  
-# ربط ملفات static (مثل css و js) لتقديمها
+# ربط ملفات static (مثل css و js) لتقديمها، مع النسخ المضغوطة ذات البصمة من scripts/build_assets
+app.mount("/static", PrecompressedStaticFiles(directory="static"), name="static")
 
 templates = Jinja2Templates(directory="templates")
+templates.env.globals["asset_url"] = asset_url
+templates.env.globals["page_lang"] = page_lang
+templates.env.globals["i18n_bundle"] = i18n_bundle
 
 # تعيين limiter في app.state
 app.state.limiter = limiter
@@ -116,6 +138,58 @@ def contact_page(request: Request):
 # إضافة middleware الخاص بـ slowapi
 app.add_middleware(SlowAPIMiddleware)
 
+# بروفايلر لطلب واحد: ?profile=1 يرجع تقرير pyinstrument بدل الاستجابة (مفعل فقط عبر PROFILING_ENABLED=1)
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "0") == "1"
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.001"))
+
+
+async def profile_request(request: Request, call_next):
+    try:
+        from pyinstrument import Profiler
+    except ImportError:
+        print("⚠️ pyinstrument is not installed, profiling skipped")
+        return await call_next(request)
+
+    profiler = Profiler(interval=PROFILE_INTERVAL, async_mode="enabled")
+    profiler.start()
+    try:
+        await call_next(request)
+    finally:
+        profiler.stop()
+    return HTMLResponse(profiler.output_html())
+
+
+def route_label(request: Request) -> str:
+    # قالب المسار (/restaurants/{restaurant_id}) بدل الرابط الفعلي حتى لا تتضخم المقاييس
+    route = request.scope.get("route")
+    if route is not None:
+        return route.path
+    if request.url.path.startswith("/static/"):
+        return "/static"
+    return "unmatched"
+
+
+# آخر middleware يضاف هو الخارجي، فيقيس زمن الطلب كاملاً
+@app.middleware("http")
+async def metrics_middleware(request: Request, call_next):
+    if PROFILING_ENABLED and request.query_params.get("profile") == "1":
+        return await profile_request(request, call_next)
+
+    stats = metrics.RequestStats()
+    token = metrics.current_request.set(stats)
+    start = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+    finally:
+        elapsed = time.perf_counter() - start
+        metrics.current_request.reset(token)
+        metrics.record_request(request.method, route_label(request), status_code, elapsed, stats)
+
+    response.headers["Server-Timing"] = stats.server_timing(elapsed)
+    return response
+
 # معالج خطأ تجاوز الحد (rate limit)
 @app.exception_handler(RateLimitExceeded)
 async def rate_limit_handler(request: Request, exc: RateLimitExceeded):
@@ -132,10 +206,61 @@ async def rate_limit_handler(request: Request, exc: RateLimitExceeded):
 
 
 
+# مهام دورية داخل التطبيق
+scheduler = BackgroundScheduler()
+
 # إنشاء الجداول عند بدء التشغيل
 @app.on_event("startup")
 def startup_event():
     Base.metadata.create_all(bind=engine)
+    expiry_in_app = os.getenv("EXPIRY_IN_APP", "1") == "1"
+
+    # بناء سجل سعة الفترات من جدول الحجوزات
+    db = SessionLocal()
+    try:
+        ledger.rebuild(db)
+        # مواعيد انتهاء الحجوزات المؤقتة الحالية
+        if expiry_in_app:
+            hold_timer.rebuild(db)
+        # فهرس البحث في المطاعم
+        search_index.build(db, query_catalog_state(db))
+    finally:
+        db.close()
+
+    # عامل إرسال البريد في الخلفية (يمكن تشغيله مستقلاً عبر python mailer.py)
+    if os.getenv("EMAIL_WORKER", "1") == "1":
+        start_worker()
+
+    # انتهاء الحجوزات المؤقتة داخل التطبيق (مؤقت لكل حجز + تنظيف احتياطي)، أو عبر cron.py
+    if expiry_in_app:
+        hold_timer.start()
+        scheduler.add_job(sweep_expired_bookings, 'interval', seconds=SWEEP_BACKSTOP_SECONDS, max_instances=1)
+    # سجل السعة يصحح فترة فترة (refresh / refresh_stale)؛ الدورة تحذف الأيام الماضية فقط بدون قاعدة البيانات
+    scheduler.add_job(ledger.prune, 'interval', seconds=SWEEP_INTERVAL_SECONDS, max_instances=1)
+    # فهرس البحث أيضاً خاص بكل عملية: يعاد بناؤه إذا عدّل worker آخر كتالوج المطاعم
+    scheduler.add_job(refresh_search_index, 'interval', seconds=SEARCH_INDEX_REFRESH_SECONDS, max_instances=1)
+    # أحداث Stripe التي فشلت معالجتها (أو توقف التطبيق قبلها)، وأول دورة عند التشغيل
+    scheduler.add_job(redrive_stripe_events, 'interval', seconds=STRIPE_REDRIVE_SECONDS,
+                      max_instances=1, next_run_time=datetime.now())
+    scheduler.start()
+
+
+def refresh_search_index():
+    db = SessionLocal()
+    try:
+        # استعلام تجميعي واحد؛ البناء الكامل فقط عند تغير الكتالوج
+        state = query_catalog_state(db)
+        if state != search_index.state:
+            search_index.build(db, state)
+    finally:
+        db.close()
+
+
+@app.on_event("shutdown")
+def shutdown_event():
+    scheduler.shutdown(wait=False)
+    hold_timer.stop()
+    stop_worker()
 
 # جلسة قاعدة البيانات
 def get_db():
@@ -145,16 +270,6 @@ def get_db():
     finally:
         db.close()
 
-# دالة لتشفير كلمة السر
-def hash_password(password: str) -> str:  # NEW
-    salt = bcrypt.gensalt()
-    hashed = bcrypt.hashpw(password.encode('utf-8'), salt)
-    return hashed.decode('utf-8')
-
-# دالة لفك تشفير كلمة السر
-def verify_password(plain_password: str, hashed_password: str) -> bool:  # NEW
-    return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
-
 # دالة لتوليد JWT
 def create_access_token(data: dict, expires_delta: Optional[int] = None):  # NEW
     import datetime
@@ -169,7 +284,24 @@ def admin_required(
     db: Session = Depends(get_db)
     ) -> User:
     user = get_current_user_from_session(request, db) 
-    if user.role != "admin":
+    # الدور من قاعدة البيانات وليس من كاش الجلسة: سحب صلاحية الأدمن يسري فوراً في كل العمليات
+    role = db.query(User.role).filter(User.token == request.session.get('user')).scalar()
+    if role is None:
+        raise HTTPException(status_code=401, detail="توكن غير صالح أو غير موجود.")
+    if role != "admin":
+        raise HTTPException(status_code=403, detail="غير مصرح لك بالوصول إلى هذا المورد.")
+    return user
+
+# نسخة غير متزامنة للـ endpoints التي تستخدم get_async_db
+async def admin_required_async(
+    request: Request,
+    db: AsyncSession = Depends(get_async_db)
+    ) -> User:
+    user = await get_current_user_from_session_async(request, db)
+    role = await db.scalar(select(User.role).where(User.token == request.session.get('user')))
+    if role is None:
+        raise HTTPException(status_code=401, detail="توكن غير صالح أو غير موجود.")
+    if role != "admin":
         raise HTTPException(status_code=403, detail="غير مصرح لك بالوصول إلى هذا المورد.")
     return user
 
@@ -227,9 +359,9 @@ class UserRegister(BaseModel):
     password_confirmation: str
 
 @app.get("/", response_class=HTMLResponse)
-async def index(request: Request, db: Session = Depends(get_db)):
+async def index(request: Request, db: AsyncSession = Depends(get_async_db)):
     try:
-        current_user = get_current_user_from_session(request, db)
+        current_user = await get_current_user_from_session_async(request, db)
     except HTTPException:
         current_user = None  # إذا ما فيه جلسة مسجل دخول، خلي current_user None
 
@@ -271,35 +403,105 @@ async def pay(request: Request, s: str = Query(...), db: Session = Depends(get_d
     })
 
 
+# تغيير لغة الموقع (تحفظ في الجلسة وتستخدم لحقن ترجمات الصفحات)
+@app.post("/lang")
+async def set_language(request: Request):
+    data = await request.json()
+    lang = data.get("lang")
+    if lang not in SUPPORTED_LANGS:
+        return JSONResponse(status_code=400, content={"status": "error", "message": "اللغة غير مدعومة."})
+    request.session["lang"] = lang
+    return {"status": "success", "lang": lang}
+
+
 # نقطة اختبار
 @app.get("/ok")
 async def ok():
     return {"status": "success", "message": "The API is working."}
 
-# 🔹 دالة لتوحيد النصوص وإزالة الهمزات
-def normalize_text(text: str):
-    return (
-        (text or "")
-        .replace("أ", "ا")
-        .replace("إ", "ا")
-        .replace("آ", "ا")
-        .replace("ة", "ه")
-        .replace("ى", "ي")
-        .lower()
-        .strip()
-    )
+# نقاط المراقبة ليست عامة: Authorization: Bearer <MONITORING_TOKEN> (لـ Prometheus وأدوات المراقبة)
+# أو جلسة أدمن. بدون MONITORING_TOKEN تبقى للأدمن فقط
+MONITORING_TOKEN = os.getenv("MONITORING_TOKEN")
 
-# 🔹 جلب جميع المطاعم مع بحث ذكي وفلاتر + عدد الحجز اليوم + ترتيب حسب أعلى الحجوزات
-@app.get("/restaurants")
-def get_restaurants(
-    search: Optional[str] = Query(None),
-    area: Optional[str] = Query(None),
-    cuisine: Optional[str] = Query(None),
-    lang: str = Query("ar"),
-    limit: Optional[int] = Query(3),
-    db: Session = Depends(get_db)
+
+async def monitoring_access(
+    request: Request,
+    authorization: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_async_db)
 ):
+    if MONITORING_TOKEN and authorization and secrets.compare_digest(authorization.encode(), f"Bearer {MONITORING_TOKEN}".encode()):
+        return
+    await admin_required_async(request, db)
+
+
+# إحصائيات مجموعة اتصالات قاعدة البيانات (لضبط حجمها حسب عدد workers)
+@app.get("/stats/pool", dependencies=[Depends(monitoring_access)])
+async def get_pool_stats():
+    return {"status": "success", "pools": pool_stats()}
+
+# مقاييس بصيغة Prometheus (لكل عملية worker)
+@app.get("/metrics", dependencies=[Depends(monitoring_access)])
+async def get_metrics():
+    pools = pool_stats()
+    extra = []
+    for field in ("checked_out", "overflow", "timeouts", "wait_seconds_total"):
+        extra += metrics.gauge_lines(
+            f"db_pool_{field}", f"Connection pool {field.replace('_', ' ')}.",
+            [({"pool": name}, stats[field]) for name, stats in pools.items()]
+        )
+    extra += metrics.gauge_lines("booking_holds_scheduled", "Pending holds waiting in the hold timer.", [({}, len(hold_timer))])
+    extra += metrics.gauge_lines("booking_sweep_last_expired", "Bookings expired by the last sweep.", [({}, last_sweep["expired"])])
+    extra += metrics.gauge_lines("booking_sweep_last_seconds", "Duration of the last sweep.", [({}, round(last_sweep["seconds"], 6))])
+    return PlainTextResponse(metrics.render(extra), media_type="text/plain; version=0.0.4")
+
+# كاش قوائم المطاعم والفلاتر: عدد حجوزات اليوم يتغير كثيراً لذا مدته قصيرة
+RESTAURANTS_CACHE_TTL = float(os.getenv("RESTAURANTS_CACHE_TTL", "30"))
+FILTERS_CACHE_TTL = float(os.getenv("FILTERS_CACHE_TTL", "600"))
+restaurant_listings = TTLCache(maxsize=512, ttl=RESTAURANTS_CACHE_TTL)
+restaurant_filters = TTLCache(maxsize=8, ttl=FILTERS_CACHE_TTL)
+
+# حالة كتالوج المطاعم من قاعدة البيانات (مشتركة بين كل العمليات): عدد المطاعم وآخر updated_at.
+# الإضافة والحذف تغير العدد والتعديل يغير آخر تاريخ، فتبنى منها ETag الفلاتر ومفاتيح الكاش،
+# ويرى كل worker تعديلات غيره خلال CATALOG_STATE_TTL ثانية على الأكثر
+CATALOG_STATE_TTL = float(os.getenv("CATALOG_STATE_TTL", "5"))
+catalog_states = TTLCache(maxsize=1, ttl=CATALOG_STATE_TTL)
+SEARCH_INDEX_REFRESH_SECONDS = float(os.getenv("SEARCH_INDEX_REFRESH_SECONDS", "30"))
+
+
+def query_catalog_state(db: Session) -> tuple:
+    return tuple(db.query(func.count(Restaurant.id), func.max(Restaurant.updated_at)).one())
+
+
+def catalog_state(db: Session) -> tuple:
+    state = catalog_states.get("restaurants")
+    if state is None:
+        state = query_catalog_state(db)
+        catalog_states.set("restaurants", state)
+    return state
+
+
+def catalog_tag(state: tuple) -> str:
+    count, last_modified = state
+    return f"{count}.{last_modified.strftime('%Y%m%d%H%M%S%f') if last_modified else 0}"
+
+
+def invalidate_restaurant_cache(filters: bool = True):
+    # الفلاتر تتغير فقط عند إضافة/تعديل/حذف مطعم، وليس عند تأكيد حجز
+    restaurant_listings.clear()
+    if filters:
+        restaurant_filters.clear()
+        # العملية التي عدّلت ترى التغيير فوراً، والباقي بعد انتهاء مدة الحالة
+        catalog_states.clear()
+
+
+def restaurant_listing(db: Session, lang: str, area: Optional[str] = None, cuisine: Optional[str] = None,
+                       search: Optional[str] = None, limit: Optional[int] = 3):
+    # يرجع (data, body, etag): القائمة لعرضها في صفحة HTML، وجسم JSON جاهز للـ API مع بصمته (نفس عنصر الكاش)
     today = date.today()
+    cache_key = (lang, area, cuisine, search, limit, today, catalog_state(db))
+    cached = restaurant_listings.get(cache_key)
+    if cached is not None:
+        return cached
 
     # جدول المطاعم + عدد الحجوزات اليوم
     query = (
@@ -329,53 +531,57 @@ def get_restaurants(
             )
         )
 
+    # البحث من الفهرس في الذاكرة (يتجاهل الهمزات والتاء المربوطة ويتسامح مع الأخطاء)
+    ranks = None
     if search:
-        search_pattern = f"%{search}%"
-        query = query.filter(
-            or_(
-                Restaurant.name.ilike(search_pattern),
-                Restaurant.name_en.ilike(search_pattern),
-                Restaurant.area.ilike(search_pattern),
-                Restaurant.area_en.ilike(search_pattern),
-                Restaurant.cuisine.ilike(search_pattern),
-                Restaurant.cuisine_en.ilike(search_pattern)
-            )
-        )
+        matches = search_index.search(search)
+        if not matches:
+            body = dumps({"status": "success", "data": []})
+            cached = ([], body, content_etag(body))
+            restaurant_listings.set(cache_key, cached)
+            return cached
+        ranks = {restaurant_id: position for position, (restaurant_id, _) in enumerate(matches)}
+        query = query.filter(Restaurant.id.in_(ranks.keys()))
 
     # تجميع وعدّ الحجوزات اليوم لكل مطعم
     query = query.group_by(Restaurant.id)
 
-    # ترتيب حسب أكثر عدد حجوزات اليوم
-    query = query.order_by(func.count(Booking.id).desc())
+    if ranks is None:
+        # ترتيب حسب أكثر عدد حجوزات اليوم
+        query = query.order_by(func.count(Booking.id).desc())
 
-    # حد أقصى
-    if limit:
-        query = query.limit(limit)
+        # حد أقصى
+        if limit:
+            query = query.limit(limit)
 
-    results = query.all()
+        results = query.all()
+    else:
+        # ترتيب حسب درجة التطابق ثم تطبيق الحد
+        results = sorted(query.all(), key=lambda r: ranks[r.Restaurant.id])
+        if limit:
+            results = results[:limit]
 
     # تحويل النتائج للـ JSON مع اللغة
-    data = [
-        {
-            "id": r.Restaurant.id,
-            "name": r.Restaurant.name if lang == "ar" else r.Restaurant.name_en or r.Restaurant.name,
-            "area": r.Restaurant.area if lang == "ar" else r.Restaurant.area_en or r.Restaurant.area,
-            "cuisine": r.Restaurant.cuisine if lang == "ar" else r.Restaurant.cuisine_en or r.Restaurant.cuisine,
-            "opens_at": r.Restaurant.opens_at.strftime("%H:%M"),
-            "closes_at": r.Restaurant.closes_at.strftime("%H:%M"),
-            "capacity": r.Restaurant.capacity,
-            "today_bookings": r.today_bookings,
-            "created_at": r.Restaurant.created_at.isoformat(),
-            "updated_at": r.Restaurant.updated_at.isoformat()
-        } for r in results
-    ]
-
-    return {"status": "success", "data": data}
+    serialize = restaurant_serializer(lang)
+    data = []
+    for r in results:
+        item = serialize(r.Restaurant)
+        item["today_bookings"] = r.today_bookings
+        data.append(item)
 
+    body = dumps({"status": "success", "data": data})
+    cached = (data, body, content_etag(body))
+    restaurant_listings.set(cache_key, cached)
+    return cached
+
+
+def restaurant_filter_options(db: Session, lang: str) -> dict:
+    # المفتاح يشمل حالة الكتالوج، فتعديل مطعم في عملية أخرى يبني الفلاتر من جديد
+    cache_key = (lang, catalog_state(db))
+    filters = restaurant_filters.get(cache_key)
+    if filters is not None:
+        return filters
 
-# ====== المطاعم - جلب قائمة الفلاتر ======
-@app.get("/restaurants/filters")
-def get_restaurant_filters(lang: str = "ar", db: Session = Depends(get_db)):
     if lang == "en":
         cuisines = db.query(Restaurant.cuisine_en).distinct().all()
         areas = db.query(Restaurant.area_en).distinct().all()
@@ -384,28 +590,73 @@ def get_restaurant_filters(lang: str = "ar", db: Session = Depends(get_db)):
         areas = db.query(Restaurant.area).distinct().all()
 
     # flatten من tuples إلى قائمة بسيطة
-    cuisines = [c[0] for c in cuisines if c[0]]
-    areas = [a[0] for a in areas if a[0]]
-
-    return {
-        "status": "success",
-        "filters": {
-            "cuisines": cuisines,
-            "areas": areas
-        }
+    filters = {
+        "cuisines": [c[0] for c in cuisines if c[0]],
+        "areas": [a[0] for a in areas if a[0]]
     }
+    restaurant_filters.set(cache_key, filters)
+    return filters
+
+
+# 🔹 جلب جميع المطاعم مع بحث ذكي وفلاتر + عدد الحجز اليوم + ترتيب حسب أعلى الحجوزات
+@app.get("/restaurants")
+def get_restaurants(
+    request: Request,
+    search: Optional[str] = Query(None),
+    area: Optional[str] = Query(None),
+    cuisine: Optional[str] = Query(None),
+    lang: str = Query("ar"),
+    limit: Optional[int] = Query(3),
+    db: Session = Depends(get_db)
+):
+    # الكاش يحفظ جسم الاستجابة جاهزاً (bytes) مع بصمته؛ عدد حجوزات اليوم جزء من المحتوى
+    # فالـ ETag من المحتوى نفسه وليس من إصدار الكتالوج
+    _, body, tag = restaurant_listing(db, lang, area, cuisine, search, limit)
+    if if_none_match(request, tag):
+        return not_modified(tag)
+    return json_response(body, headers=validators(tag))
+
+
+# ====== المطاعم - جلب قائمة الفلاتر ======
+@app.get("/restaurants/filters")
+def get_restaurant_filters(request: Request, lang: str = "ar", db: Session = Depends(get_db)):
+    # الفلاتر تتغير فقط مع الكتالوج: المقارنة بحالته المخزنة مؤقتاً (بدون استعلام غالباً)
+    state = catalog_state(db)
+    tag = etag("filters", "en" if lang == "en" else "ar", catalog_tag(state))
+    last_modified = state[1]
+    if if_none_match(request, tag):
+        return not_modified(tag, last_modified)
+
+    return json_response(
+        dumps({"status": "success", "filters": restaurant_filter_options(db, lang)}),
+        headers=validators(tag, last_modified)
+    )
+
+
+# عدد المطاعم في الصفحة الأولى (نفس limit الذي يطلبه الـ JS عند الفلترة)
+RESTAURANTS_PAGE_LIMIT = 10
 
 
 # ======= صفحة المطاعم (HTML) =======
+# القائمة الأولى والفلاتر ترسم في الخادم من نفس الكاش، والـ JS يتولى الفلترة والبحث بعدها فقط
 @app.get("/restaurants_page")
-def restaurants_page(request: Request):
-    return templates.TemplateResponse("restaurants.html", {"request": request})
+def restaurants_page(request: Request, db: Session = Depends(get_db)):
+    lang = session_lang(request)
+    restaurants = restaurant_listing(db, lang, limit=RESTAURANTS_PAGE_LIMIT)[0]
+    return templates.TemplateResponse("restaurants.html", {
+        "request": request,
+        "restaurants": restaurants,
+        "filters": restaurant_filter_options(db, lang),
+        "page_limit": RESTAURANTS_PAGE_LIMIT,
+        "t": catalog[lang]
+    })
 
 
 from fastapi import Query
 
 @app.get("/restaurants/{restaurant_id}")
 def get_restaurant_by_id(
+    request: Request,
     restaurant_id: int,
     lang: str = Query("ar"),  # اللغة الافتراضية عربي
     db: Session = Depends(get_db)
@@ -413,28 +664,23 @@ def get_restaurant_by_id(
     restaurant = db.query(Restaurant).filter(Restaurant.id == restaurant_id).first()
     if not restaurant:
         raise HTTPException(status_code=404, detail="المطعم غير موجود.")
-    
-    return {
-        "status": "success",
-        "data": {
-            "id": restaurant.id,
-            "name": restaurant.name if lang == "ar" else restaurant.name_en or restaurant.name,
-            "area": restaurant.area if lang == "ar" else restaurant.area_en or restaurant.area,
-            "cuisine": restaurant.cuisine if lang == "ar" else restaurant.cuisine_en or restaurant.cuisine,
-            "opens_at": restaurant.opens_at.strftime("%H:%M"),
-            "closes_at": restaurant.closes_at.strftime("%H:%M"),
-            "capacity": restaurant.capacity,
-            "created_at": restaurant.created_at.isoformat(),
-            "updated_at": restaurant.updated_at.isoformat()
-        }
-    }
+
+    # ETag من updated_at في نفس الاستعلام بالمفتاح: يتغير مع أي تعديل مهما كانت العملية التي عدّلت
+    tag = etag("restaurant", restaurant_id, "ar" if lang == "ar" else "en",
+               restaurant.updated_at.strftime("%Y%m%d%H%M%S%f"))
+    if if_none_match(request, tag) or not_modified_since(request, restaurant.updated_at):
+        return not_modified(tag, restaurant.updated_at)
+
+    response = ok_response(data=restaurant_serializer(lang)(restaurant))
+    response.headers.update(validators(tag, restaurant.updated_at))
+    return response
 
 # المطاعم - إنشاء مطعم
 @app.post("/restaurants", status_code=201)
 async def create_restaurant(
     restaurant: RestaurantCreate = Body(...),
-    db: Session = Depends(get_db),
-    user: User = Depends(admin_required)  # NEW: السماح للادمن فقط
+    db: AsyncSession = Depends(get_async_db),
+    user: User = Depends(admin_required_async)  # NEW: السماح للادمن فقط
 ):
     opens_time = datetime.strptime(restaurant.opens_at, "%H:%M").time()
     closes_time = datetime.strptime(restaurant.closes_at, "%H:%M").time()
@@ -453,8 +699,10 @@ async def create_restaurant(
         updated_at=datetime.utcnow()
     )
     db.add(new_restaurant)
-    db.commit()
-    db.refresh(new_restaurant)
+    await db.commit()
+    await db.refresh(new_restaurant)
+    search_index.upsert(new_restaurant)
+    invalidate_restaurant_cache()
 
     return {
         "status": "success",
@@ -469,10 +717,10 @@ async def create_restaurant(
 async def update_restaurant(
     restaurant_id: int,
     restaurant_update: RestaurantUpdate = Body(...),
-    db: Session = Depends(get_db),
-    user: User = Depends(admin_required)  # NEW: السماح للادمن فقط
+    db: AsyncSession = Depends(get_async_db),
+    user: User = Depends(admin_required_async)  # NEW: السماح للادمن فقط
 ):
-    restaurant = db.query(Restaurant).filter(Restaurant.id == restaurant_id).first()
+    restaurant = await db.scalar(select(Restaurant).where(Restaurant.id == restaurant_id))
     if not restaurant:
         raise HTTPException(status_code=404, detail="المطعم غير موجود.")
 
@@ -499,8 +747,10 @@ async def update_restaurant(
     restaurant.capacity = capacity
     restaurant.updated_at = datetime.utcnow()
 
-    db.commit()
-    db.refresh(restaurant)
+    await db.commit()
+    await db.refresh(restaurant)
+    search_index.upsert(restaurant)
+    invalidate_restaurant_cache()
 
     return {"status": "success", "message": "تم تحديث المطعم بنجاح"}
 
@@ -517,20 +767,24 @@ def delete_restaurant(
 
     db.delete(restaurant)
     db.commit()
+    search_index.remove(restaurant_id)
+    invalidate_restaurant_cache()
     return {"status": "success", "message": "تم حذف المطعم بنجاح"}
 
 
 # تسجيل مستخدم جديد
 @app.post("/register", status_code=201)
-async def register_user(user: UserRegister, db: Session = Depends(get_db)):
+@limiter.limit(REGISTER_LIMIT)
+async def register_user(request: Request, user: UserRegister, db: AsyncSession = Depends(get_async_db)):
     if user.password != user.password_confirmation:
         return JSONResponse(status_code=400, content={"status": "error", "message": "كلمتا المرور غير متطابقتين."})
 
-    existing_user = db.query(User).filter(User.email == user.email).first()
+    existing_user = await db.scalar(select(User.id).where(User.email == user.email))
     if existing_user:
         return JSONResponse(status_code=409, content={"status": "error", "message": "البريد الإلكتروني مستخدم بالفعل."})
 
-    hashed_password = bcrypt.hashpw(user.password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+    # التشفير في thread pool حتى لا يوقف حلقة الأحداث
+    hashed_password = await hash_password_async(user.password)
     token = secrets.token_hex(16)  # NEW: إنشاء توكن عشوائي لتوثيق المستخدم
 
     new_user = User(
@@ -543,10 +797,10 @@ async def register_user(user: UserRegister, db: Session = Depends(get_db)):
         role="user"  # NEW: تعيين الدور الافتراضي للمستخدم (مستخدم عادي)
     )
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
-
-    send_welcome_email(new_user.fullname, new_user.email)
+    # رسالة الترحيب في نفس معاملة إنشاء المستخدم
+    send_welcome_email(new_user.fullname, new_user.email, db=db)
+    await db.commit()
+    await db.refresh(new_user)
 
 
 
@@ -562,8 +816,8 @@ async def register_user(user: UserRegister, db: Session = Depends(get_db)):
 
 # تسجيل الدخول
 @app.post("/login")
-@limiter.limit("5/minute")
-async def login_user(request: Request, db: Session = Depends(get_db)):
+@limiter.limit(LOGIN_LIMIT)
+async def login_user(request: Request, db: AsyncSession = Depends(get_async_db)):
     data = await request.json()
     email = data.get("email")
     password = data.get("password")
@@ -575,16 +829,21 @@ async def login_user(request: Request, db: Session = Depends(get_db)):
         )
 
     # البحث عن المستخدم في قاعدة البيانات
-    user = db.query(User).filter(User.email == email).first()
+    user = await db.scalar(select(User).where(User.email == email))
 
     # التحقق من كلمة المرور
-    if user and bcrypt.checkpw(password.encode('utf-8'), user.password.encode('utf-8')):
-        # إنشاء توكن جديد
+    if user and await verify_password_async(password, user.password):
+        # إعادة التشفير إذا تغير معامل التكلفة منذ آخر تشفير
+        if needs_rehash(user.password):
+            user.password = await hash_password_async(password)
+
+        # إنشاء توكن جديد (التوكن القديم لم يعد صالحاً)
         token = secrets.token_hex(16)
         user.token = token
         user.last_login = datetime.utcnow()
-        db.commit()
-        db.refresh(user)
+        await db.commit()
+        await db.refresh(user)
+        invalidate_user_sessions(user.id)
 
         # ✅ تخزين التوكن + user_id + role في الجلسة
         request.session['user'] = user.token
@@ -647,7 +906,7 @@ def get_user(request: Request, db: Session = Depends(get_db)):
     if not token:
         return {"status": "error", "message": "المستخدم غير مسجل"}
     
-    user = db.query(User).filter(User.token == token).first()
+    user = get_user_by_token(token, db)
     if not user:
         return {"status": "error", "message": "توكن غير صالح"}
 
@@ -662,20 +921,73 @@ def get_user(request: Request, db: Session = Depends(get_db)):
 
 @app.get("/logout")
 async def logout(request: Request):
+    token = request.session.get('user')
+    if token:
+        session_users.pop(token)
     request.session.clear()  # 🧹 مسح الجلسة بالكامل
     return RedirectResponse(url="/login", status_code=303)
 
 
+# كاش المستخدمين حسب توكن الجلسة (يُمسح عند تسجيل الدخول والخروج وتغيير الدور)
+# الكاش خاص بكل عملية ومسحه محلي فقط: مع عدة workers يبقى توكن قديم (بعد تسجيل دخول جديد أو خروج)
+# أو بيانات مستخدم قديمة صالحة في العمليات الأخرى حتى SESSION_CACHE_TTL ثانية. هذا مقبول للقراءة؛
+# صلاحية الأدمن لا تعتمد عليه (admin_required يقرأ الدور من قاعدة البيانات). SESSION_CACHE_TTL=0 يعطله.
+SESSION_CACHE_TTL = float(os.getenv("SESSION_CACHE_TTL", "10"))
+SESSION_CACHE_SIZE = int(os.getenv("SESSION_CACHE_SIZE", "10000"))
+session_users = TTLCache(maxsize=SESSION_CACHE_SIZE, ttl=SESSION_CACHE_TTL)
+
+
+def get_user_by_token(token: str, db: Session) -> Optional[User]:
+    user = session_users.get(token)
+    if user is not None:
+        return user
+
+    user = db.query(User).filter(User.token == token).first()
+    if user:
+        # نفصل الكائن عن الجلسة حتى يبقى صالحاً للقراءة بعد إغلاقها
+        db.expunge(user)
+        session_users.set(token, user)
+    return user
+
+
+async def get_user_by_token_async(token: str, db: AsyncSession) -> Optional[User]:
+    user = session_users.get(token)
+    if user is not None:
+        return user
+
+    user = await db.scalar(select(User).where(User.token == token))
+    if user:
+        db.expunge(user)
+        session_users.set(token, user)
+    return user
+
+
+def invalidate_user_sessions(user_id: int):
+    # يستدعى عند تغيير التوكن أو الدور لمستخدم
+    session_users.discard_where(lambda token, user: user.id == user_id)
+
+
 def get_current_user_from_session(request: Request, db: Session):
     # أخذ التوكن من الجلسة
     token: Optional[str] = request.session.get('user')
-    print('my token', token)
-    
+
     if not token:
         raise HTTPException(status_code=401, detail="الرمز غير موجود في الجلسة.")
 
-    # البحث عن المستخدم بالتوكن في قاعدة البيانات
-    user = db.query(User).filter(User.token == token).first()
+    # البحث عن المستخدم بالتوكن (من الكاش أو قاعدة البيانات)
+    user = get_user_by_token(token, db)
+    if not user:
+        raise HTTPException(status_code=401, detail="توكن غير صالح أو غير موجود.")
+
+    return user
+
+async def get_current_user_from_session_async(request: Request, db: AsyncSession):
+    token: Optional[str] = request.session.get('user')
+
+    if not token:
+        raise HTTPException(status_code=401, detail="الرمز غير موجود في الجلسة.")
+
+    user = await get_user_by_token_async(token, db)
     if not user:
         raise HTTPException(status_code=401, detail="توكن غير صالح أو غير موجود.")
 
@@ -748,19 +1060,107 @@ class BookingUpdate(BaseModel):
         except:
             raise ValueError("صيغة الوقت يجب أن تكون HH:MM.")
         
+# استعلامات مسارات الحجز في دوال مستقلة يعدها scripts/check_query_counts.py
+def booking_restaurant_query(restaurant_id: int):
+    # الأعمدة المطلوبة فقط بدل تحميل كائن المطعم كاملاً
+    return select(Restaurant.id, Restaurant.name, Restaurant.capacity).where(Restaurant.id == restaurant_id)
+
+
+async def admit_booking(db: AsyncSession, new_booking: Booking):
+    """
+    القبول النهائي داخل معاملة الإدراج (مشترك بين كل العمليات): قفل صف المطعم
+    ثم مجموع المقاعد المحجوزة في الفترة، فلا يتجاوز طلبان متزامنان السعة ولو في عمليتين مختلفتين.
+    يرجع (admitted, capacity, booked)، و capacity فارغة إذا حذف المطعم.
+    """
+    try:
+        if needs_write_lock(db):
+            await db.execute(restaurant_write_lock(new_booking.restaurant_id))
+        capacity = await db.scalar(restaurant_lock_query(new_booking.restaurant_id))
+        booked = await db.scalar(held_people_query(new_booking.restaurant_id, new_booking.date, new_booking.time))
+        admitted = capacity is not None and booked + new_booking.people <= capacity
+        if admitted:
+            db.add(new_booking)
+            await db.commit()
+        else:
+            await db.rollback()
+    except Exception:
+        await db.rollback()
+        raise
+    return admitted, capacity, booked
+
+
+def restaurant_hours(db: Session, restaurant_id: int):
+    return (
+        db.query(Restaurant.id, Restaurant.opens_at, Restaurant.closes_at)
+        .filter(Restaurant.id == restaurant_id)
+        .first()
+    )
+
+
+def move_booking(db: Session, booking: Booking, new_date: date, new_time: time_type, people: int) -> bool:
+    """
+    نفس القبول المشترك كما في إنشاء الحجز: قفل صف المطعم ثم مجموع الفترة الجديدة من الجدول
+    (باستثناء الحجز نفسه). يرجع False بدون تعديل إذا لم تتسع الفترة.
+    """
+    booking_id = booking.id
+    old_slot = (booking.restaurant_id, slot_date(booking.date), booking.time)
+    new_slot = (booking.restaurant_id, new_date, new_time)
+    # قراءات المسار قبلنا (المستخدم، الحجز، ساعات العمل) تثبت لقطة REPEATABLE READ في MySQL، والمجموع
+    # بعد القفل يقرأ من تلك اللقطة فلا يرى حجوزات قُبلت بعدها. ننهي المعاملة حتى يكون القفل أول ما فيها
+    db.rollback()
+    if needs_write_lock(db):
+        db.execute(restaurant_write_lock(new_slot[0]))
+    capacity = db.scalar(restaurant_lock_query(new_slot[0]))
+    booked = db.scalar(held_people_query(*new_slot, exclude_booking_id=booking_id))
+    if booked + people > capacity:
+        db.rollback()
+        return False
+
+    try:
+        db.query(Booking).filter(Booking.id == booking_id).update(
+            {Booking.date: new_date, Booking.time: new_time, Booking.people: people},
+            synchronize_session=False
+        )
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    # الفترتان من قاعدة البيانات بعد التغيير
+    ledger.refresh(db, [old_slot, new_slot])
+    return True
+
+
+def cancel_user_booking(db: Session, booking: Booking):
+    # القيم قبل commit حتى لا يعاد تحميل الحجز لأجلها
+    booking_id = booking.id
+    slot = (booking.restaurant_id, slot_date(booking.date), booking.time)
+    was_held = booking.status in HELD_STATUSES
+    booking.status = BookingStatus.cancelled
+    db.commit()
+    hold_timer.discard(booking_id)
+    if was_held:
+        # قيمة الفترة من قاعدة البيانات: الحجز ربما قُبل في عملية أخرى
+        ledger.refresh(db, [slot])
+
+
+def restaurant_name(db: Session, restaurant_id: int) -> Optional[str]:
+    return db.query(Restaurant.name).filter(Restaurant.id == restaurant_id).scalar()
+
+
 @app.post("/bookings", status_code=201)
+@limiter.limit(BOOKING_LIMIT)
 async def create_booking(
     booking: BookingCreate,
     request: Request,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     # الحصول على المستخدم
-    user = get_current_user_from_session(request, db)
+    user = await get_current_user_from_session_async(request, db)
     if not user:
         raise HTTPException(status_code=401, detail="يجب تسجيل الدخول.")
 
     # التحقق من المطعم
-    restaurant = db.query(Restaurant).filter(Restaurant.id == booking.restaurant_id).first()
+    restaurant = (await db.execute(booking_restaurant_query(booking.restaurant_id))).first()
     if not restaurant:
         raise HTTPException(status_code=404, detail="المطعم غير موجود.")
 
@@ -768,57 +1168,65 @@ async def create_booking(
     booking_date = datetime.strptime(booking.date, "%Y-%m-%d").date()
     booking_time = datetime.strptime(booking.time, "%H:%M").time()
 
-    # التحقق من السعة
-    existing_bookings = db.query(Booking).filter(
-        Booking.restaurant_id == restaurant.id,
-        Booking.date == booking_date,
-        Booking.time == booking_time,
-        Booking.status == BookingStatus.confirmed
-    ).all()
-    total_people = sum(b.people for b in existing_bookings) + booking.people
-    if total_people > restaurant.capacity:
-        raise HTTPException(status_code=400, detail="السعة غير كافية لهذا الوقت.")
+    # فلتر سريع من السجل في الذاكرة: الفترة الممتلئة ترفض قبل Stripe والأقفال.
+    # السجل خاص بهذه العملية وقد لا يرى إلغاءات العمليات الأخرى، فنتأكد من قاعدة البيانات قبل الرفض
+    if ledger.remaining(restaurant.id, booking_date, booking_time, restaurant.capacity) < booking.people:
+        booked = await db.scalar(held_people_query(restaurant.id, booking_date, booking_time))
+        ledger.observe(restaurant.id, booking_date, booking_time, booked)
+        if booked + booking.people > restaurant.capacity:
+            raise HTTPException(status_code=400, detail="السعة غير كافية لهذا الوقت.")
+
+    # حساب السعر
+    amount = booking.people * 10 * 100  # 10 ريال × 100 سنت
 
-    # إنشاء الحجز مؤقت
+    # جلسة Stripe أولاً وخارج أي معاملة: لا اتصال من الـ pool ولا أقفال أثناء انتظار Stripe.
+    # الجلسة تربط بالحجز عبر مرجع نولده هنا بدل رقم الحجز الذي لا نعرفه قبل الإدراج
+    reference = secrets.token_hex(16)
+    # استعلامات المستخدم والمطعم فتحت معاملة قراءة: ننهيها حتى يعود الاتصال للـ pool
+    # (المستخدم منفصل عن الجلسة والمطعم صف أعمدة، فلا شيء يحتاج إعادة تحميل)
+    await db.rollback()
+    try:
+        # في thread pool حتى لا توقف حلقة الأحداث
+        session = await create_booking_checkout_async(
+            booking_ref=reference,
+            restaurant_name=restaurant.name,
+            booking_date=booking.date,
+            amount=amount,
+            customer_email=user.email
+        )
+    except stripe.error.StripeError as e:
+        print(f"❌ Stripe error: {e}")
+        raise HTTPException(status_code=502, detail="تعذر إنشاء جلسة الدفع، حاول مرة أخرى.")
+
+    # إنشاء الحجز مؤقت: INSERT واحد يحمل client_secret، ثم commit واحد
     new_booking = Booking(
         restaurant_id=restaurant.id,
         user_id=user.id,
         date=booking_date,
         time=booking_time,
         people=booking.people,
-        status=BookingStatus.pending
-    )
-    db.add(new_booking)
-    db.commit()
-    db.refresh(new_booking)
-
-    # حساب السعر
-    amount = booking.people * 10 * 100  # 10 ريال × 100 سنت
-
-    # إنشاء جلسة Stripe
-    session = stripe.checkout.Session.create(
-        payment_method_types=['card'],
-        line_items=[{
-            'price_data': {
-                'currency': 'sar',
-                'product_data': {
-                    'name': f"حجز مطعم {restaurant.name} بتاريخ {booking.date}"
-                },
-                'unit_amount': amount
-            },
-            'quantity': 1
-        }],
-        mode='payment',
-        ui_mode='embedded',
-        metadata={"booking_id": new_booking.id},
-        return_url=f"{BASE_URL}/booking-success?session_id={{CHECKOUT_SESSION_ID}}",
-        customer_email=user.email
+        status=BookingStatus.pending,
+        reference=reference,
+        client_secret=session.client_secret
     )
+    try:
+        admitted, capacity, booked = await admit_booking(db, new_booking)
+    except Exception:
+        await expire_checkout_session_async(session.id)
+        raise
+
+    if not admitted:
+        await expire_checkout_session_async(session.id)
+        if capacity is None:
+            raise HTTPException(status_code=404, detail="المطعم غير موجود.")
+        ledger.observe(restaurant.id, booking_date, booking_time, booked)
+        raise HTTPException(status_code=400, detail="السعة غير كافية لهذا الوقت.")
 
-    new_booking.client_secret = session.client_secret
-    db.commit()
-    db.refresh(new_booking)
+    # القيمة التي قبلنا عليها + هذا الحجز
+    ledger.observe(restaurant.id, booking_date, booking_time, booked + booking.people)
 
+    # إلغاء الحجز تلقائياً عند انتهاء مهلته إذا لم يدفع
+    hold_timer.schedule(new_booking.id)
 
     return {
         "status": "success",
@@ -826,82 +1234,183 @@ async def create_booking(
         "client_secret": session.client_secret
     }
 
-# استعراض كل حجوزات المستخدم
+# حجوزات المستخدم: ترقيم بالمؤشر (created_at, id) بدل تحميل كل السجل
+BOOKINGS_PAGE_SIZE = 20
+BOOKINGS_MAX_PAGE_SIZE = 100
+
+
+def encode_booking_cursor(booking: Booking) -> str:
+    return f"{booking.created_at.isoformat()}_{booking.id}"
+
+
+def decode_booking_cursor(cursor: str):
+    try:
+        created_at, booking_id = cursor.rsplit("_", 1)
+        return datetime.fromisoformat(created_at), int(booking_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="مؤشر الصفحة غير صالح.")
+
+
+def user_booking_summary(db: Session, user_id: int) -> dict:
+    # عدد الحجوزات لكل حالة باستعلام تجميعي واحد
+    counts = dict(
+        db.query(Booking.status, func.count(Booking.id))
+        .filter(Booking.user_id == user_id)
+        .group_by(Booking.status)
+        .all()
+    )
+    summary = {s.value: counts.get(s, 0) for s in BookingStatus}
+    summary["total"] = sum(counts.values())
+    return summary
+
+
+def user_bookings_page(
+    db: Session,
+    user_id: int,
+    cursor: Optional[str],
+    limit: int,
+    status: Optional[BookingStatus] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None
+):
+    # الفهرس (user_id, created_at) يغطي الترتيب والمؤشر، واسم المطعم في نفس الاستعلام
+    query = (
+        db.query(Booking)
+        .options(joinedload(Booking.restaurant))
+        .filter(Booking.user_id == user_id)
+    )
+    if status:
+        query = query.filter(Booking.status == status)
+    if date_from:
+        query = query.filter(Booking.date >= date_from)
+    if date_to:
+        query = query.filter(Booking.date <= date_to)
+    if cursor:
+        created_at, booking_id = decode_booking_cursor(cursor)
+        query = query.filter(or_(
+            Booking.created_at < created_at,
+            and_(Booking.created_at == created_at, Booking.id < booking_id)
+        ))
+
+    # نجلب صفاً زائداً لمعرفة وجود صفحة تالية
+    bookings = query.order_by(Booking.created_at.desc(), Booking.id.desc()).limit(limit + 1).all()
+    next_cursor = encode_booking_cursor(bookings[limit - 1]) if len(bookings) > limit else None
+    return bookings[:limit], next_cursor
+
+
+# استعراض حجوزات المستخدم (صفحة صفحة)
 @app.get("/api/bookings")
 def list_user_bookings(
     request: Request,
     db: Session = Depends(get_db),
-    lang: str = Query("ar")  # ✅ اللغة تجي من الرابط
+    lang: str = Query("ar"),  # ✅ اللغة تجي من الرابط
+    cursor: Optional[str] = Query(None),
+    limit: int = Query(BOOKINGS_PAGE_SIZE, ge=1, le=BOOKINGS_MAX_PAGE_SIZE),
+    status: Optional[BookingStatus] = Query(None),
+    date_from: Optional[date] = Query(None),
+    date_to: Optional[date] = Query(None)
 ):
-    print("📢 اللغة المستلمة:", lang)
-
     user = get_current_user_from_session(request, db)
     if not user:
         raise HTTPException(status_code=401, detail="يجب تسجيل الدخول لرؤية الحجوزات.")
 
-    bookings = (
-        db.query(Booking)
-        .options(joinedload(Booking.restaurant))
-        .filter(Booking.user_id == user.id)
-        .order_by(Booking.created_at.desc())
-        .all()
-    )
+    bookings, next_cursor = user_bookings_page(db, user.id, cursor, limit, status, date_from, date_to)
 
-    data = []
-    for b in bookings:
-        if not b.restaurant:
-            restaurant_name = "غير معروف"
-        else:
-            restaurant_name = b.restaurant.name_en if lang == "en" else b.restaurant.name
-
-        booking_data = {
-            "id": b.id,
-            "restaurant_name": restaurant_name,
-            "date": b.date.isoformat(),
-            "time": b.time.strftime("%H:%M"),
-            "people": b.people,
-            "status": b.status,
-            "created_at": b.created_at.isoformat(),
-            "updated_at": b.updated_at.isoformat()
-        }
+    serialize = user_booking_serializer(lang)
+    payload = {"data": [serialize(b) for b in bookings], "next_cursor": next_cursor}
+    # الملخص (لكل الحجوزات بدون فلاتر) مع الصفحة الأولى فقط
+    if cursor is None:
+        payload["summary"] = user_booking_summary(db, user.id)
+    return ok_response(**payload)
 
-        # ✅ إذا الحجز Pending، أضف client_secret لتمكين زر "ادفع الآن"
-        if b.status == BookingStatus.pending and hasattr(b, "client_secret"):
-            booking_data["client_secret"] = b.client_secret
 
-        data.append(booking_data)
 
-    return {"status": "success", "data": data}
+# عرض جميع الحجوزات - خاص بالأدمن فقط
+ADMIN_PAGE_SIZE = 50
+ADMIN_MAX_PAGE_SIZE = 500
+ADMIN_EXPORT_CHUNK = 1000
+ADMIN_EXPORT_FIELDS = ["id", "restaurant_name", "user_name", "date", "time", "people", "status"]
 
 
+def admin_bookings_chunk(db: Session, lang: str, before_id: Optional[int], limit: int) -> List[dict]:
+    # استعلام واحد مع join بدل استعلامين لكل حجز، مع ترقيم بالمفتاح (id) بدل OFFSET
+    query = (
+        db.query(
+            Booking.id,
+            Restaurant.name,
+            Restaurant.name_en,
+            User.fullname,
+            Booking.date,
+            Booking.time,
+            Booking.people,
+            Booking.status
+        )
+        .outerjoin(Restaurant, Restaurant.id == Booking.restaurant_id)
+        .outerjoin(User, User.id == Booking.user_id)
+    )
+    if before_id is not None:
+        query = query.filter(Booking.id < before_id)
+
+    rows = query.order_by(Booking.id.desc()).limit(limit).all()
+
+    serialize = admin_booking_serializer(lang)
+    return [serialize(r) for r in rows]
+
+
+def stream_admin_bookings(lang: str, before_id: Optional[int], export_format: str):
+    # جلسة خاصة بالبث لأن جلسة الطلب تغلق قبل انتهاء الاستجابة
+    db = SessionLocal()
+    try:
+        if export_format == "csv":
+            buffer = io.StringIO()
+            writer = csv.DictWriter(buffer, fieldnames=ADMIN_EXPORT_FIELDS)
+            writer.writeheader()
+            yield buffer.getvalue()
+
+        while True:
+            rows = admin_bookings_chunk(db, lang, before_id, ADMIN_EXPORT_CHUNK)
+            if not rows:
+                break
+
+            if export_format == "csv":
+                buffer = io.StringIO()
+                writer = csv.DictWriter(buffer, fieldnames=ADMIN_EXPORT_FIELDS)
+                writer.writerows(rows)
+                yield buffer.getvalue()
+            else:
+                yield b"".join(dumps(r) + b"\n" for r in rows)
+
+            before_id = rows[-1]["id"]
+            # تفريغ الجلسة حتى لا تتراكم الكائنات في الذاكرة
+            db.expunge_all()
+    finally:
+        db.close()
+
 
-# عرض جميع الحجوزات - خاص بالأدمن فقط
 @app.get("/api/admin/bookings")
 def get_admin_bookings(
-    lang: str = Query("ar"), 
+    lang: str = Query("ar"),
+    cursor: Optional[int] = Query(None),
+    limit: int = Query(ADMIN_PAGE_SIZE, ge=1, le=ADMIN_MAX_PAGE_SIZE),
+    format: Optional[str] = Query(None),
     db: Session = Depends(get_db),
     user: User = Depends(admin_required)
 ):
-    bookings = db.query(Booking).all()
-    result = []
-
-    for b in bookings:
-        restaurant = db.query(Restaurant).filter(Restaurant.id == b.restaurant_id).first()
-        u = db.query(User).filter(User.id == b.user_id).first()
-
-        restaurant_name = restaurant.name if lang == "ar" else restaurant.name_en
+    # التصدير: بث كل الحجوزات على دفعات (NDJSON أو CSV) بذاكرة ثابتة
+    if format in ("ndjson", "csv"):
+        media_type = "text/csv; charset=utf-8" if format == "csv" else "application/x-ndjson"
+        return StreamingResponse(
+            stream_admin_bookings(lang, cursor, format),
+            media_type=media_type,
+            headers={"Content-Disposition": f"attachment; filename=bookings.{format}"}
+        )
+    if format is not None:
+        raise HTTPException(status_code=400, detail="صيغة التصدير يجب أن تكون ndjson أو csv.")
 
-        result.append({
-            "id": b.id,
-            "restaurant_name": restaurant_name,
-            "user_name": u.fullname if u else "غير معروف",
-            "date": b.date.isoformat(),
-            "time": b.time.strftime("%H:%M"),
-            "people": b.people,
-            "status": b.status,
-        })
+    result = admin_bookings_chunk(db, lang, cursor, limit)
+    next_cursor = result[-1]["id"] if len(result) == limit else None
 
-    return {"status": "success", "data": result}
+    return ok_response(data=result, next_cursor=next_cursor)
 
 
 # استعراض حجز معين
@@ -949,33 +1458,27 @@ def update_booking(
     if new_date == datetime.utcnow().date() and new_time <= datetime.utcnow().time():
         raise HTTPException(status_code=400, detail="لا يمكن الحجز في وقت ماضٍ.")
 
-    restaurant = db.query(Restaurant).filter(Restaurant.id == booking.restaurant_id).first()
+    restaurant = restaurant_hours(db, booking.restaurant_id)
 
     # NEW: التحقق من أن وقت الحجز داخل ساعات عمل المطعم
     if new_time < restaurant.opens_at or new_time >= restaurant.closes_at:
         raise HTTPException(status_code=400, detail="الوقت خارج ساعات عمل المطعم.")
 
     # NEW: التأكد من أن السعة متاحة عند التحديث (باستثناء الحجز الحالي)
-    existing_bookings = db.query(Booking).filter(
-        Booking.restaurant_id == restaurant.id,
-        Booking.date == new_date,
-        Booking.time == new_time,
-        Booking.status == BookingStatus.confirmed,
-        Booking.id != booking.id
-    ).all()
-
-    total_people = sum(b.people for b in existing_bookings) + people_val
-    if total_people > restaurant.capacity:
+    if not move_booking(db, booking, new_date, new_time, people_val):
         raise HTTPException(status_code=400, detail="السعة غير كافية لهذا الوقت.")
-
-    booking.date = new_date
-    booking.time = new_time
-    booking.people = people_val
-    db.commit()
     db.refresh(booking)
 
     return {"status": "success", "message": "تم تحديث الحجز بنجاح"}
 
+# تنظيف يدوي للحجوزات المؤقتة المنتهية (للأدمن فقط)
+# نفس محرك الانتهاء المستخدم في المهمة الدورية (إلغاء بدل حذف).
+# يجب أن يسبق /api/bookings/{booking_id} وإلا يطابقه المسار كرقم حجز غير صالح (422)
+@app.delete("/api/bookings/cleanup")
+def cleanup_expired_bookings(user: User = Depends(admin_required)):
+    return sweep_expired_bookings()
+
+
 # إلغاء الحجز (تغيير الحالة)
 @app.delete("/api/bookings/{booking_id}")
 def cancel_booking(booking_id: int, request: Request, db: Session = Depends(get_db)):
@@ -989,26 +1492,22 @@ def cancel_booking(booking_id: int, request: Request, db: Session = Depends(get_
     if not booking:
         raise HTTPException(status_code=404, detail="الحجز غير موجود.")
     
-    # تغيير حالة الحجز إلى ملغي
-    booking.status = BookingStatus.cancelled
-    db.commit()
-
     # جلب بيانات المطعم المرتبط بالحجز
-    restaurant = db.query(Restaurant).filter(Restaurant.id == booking.restaurant_id).first()
-    service_name = restaurant.name if restaurant else "الخدمة"
+    service_name = restaurant_name(db, booking.restaurant_id) or "الخدمة"
+
+    # ✉️ إيميل إلغاء الحجز: يضاف لصندوق الصادر في نفس معاملة الإلغاء
+    send_booking_cancellation(
+        user_name=user.fullname,   # لاحظ استخدام fullname بدل name
+        user_email=user.email,
+        booking_id=booking.id,
+        date=booking.date,
+        time=booking.time,
+        service_name=service_name,
+        db=db
+    )
 
-    # ✉️ إرسال إيميل إلغاء الحجز مع معالجة الأخطاء
-    try:
-        send_booking_cancellation(
-            user_name=user.fullname,   # لاحظ استخدام fullname بدل name
-            user_email=user.email,
-            booking_id=booking.id,
-            date=booking.date,
-            time=booking.time,
-            service_name=service_name
-        )
-    except Exception as e:
-        print(f"❌ فشل إرسال إيميل الإلغاء: {e}")
+    # تغيير حالة الحجز إلى ملغي وإرجاع المقاعد للسعة (commit واحد للحالة والإيميل)
+    cancel_user_booking(db, booking)
 
     return {
         "status": "success",
@@ -1048,7 +1547,9 @@ async def contact_submit(request: Request):
     return JSONResponse({"message": response_msg})
 
 @app.get("/availability")
+@limiter.limit(AVAILABILITY_LIMIT)
 def check_availability(
+    request: Request,
     restaurant_id: int = Query(...),
     date: str = Query(...),
     time: str = Query(...),
@@ -1077,16 +1578,9 @@ def check_availability(
             "remaining": 0  # أو "" إذا تريد يطلع فاضي
         }
 
-    # حساب مجموع الأشخاص المحجوزين في نفس التاريخ والوقت
-    booked_people = (
-        db.query(func.sum(Booking.people))
-        .filter(Booking.restaurant_id == restaurant_id)
-        .filter(func.date(Booking.date) == date)
-        .filter(Booking.time == time)
-        .scalar()
-    ) or 0
-
-    remaining = max(restaurant.capacity - booked_people, 0)
+    # المتبقي من سجل السعة؛ الفترة تعاد قراءتها من جدول الحجوزات فقط إذا مضى على قيمتها LEDGER_SLOT_TTL
+    ledger.refresh_stale(db, [(restaurant_id, booking_date, booking_time)])
+    remaining = ledger.remaining(restaurant_id, booking_date, booking_time, restaurant.capacity)
 
     return {
         "status": "success",
@@ -1096,6 +1590,225 @@ def check_availability(
         "remaining": remaining
     }
 
+# طول الفترة الواحدة بالدقائق وأقصى عدد أيام في طلب واحد
+SLOT_MINUTES = int(os.getenv("SLOT_MINUTES", "60"))
+MAX_AVAILABILITY_DAYS = 31
+
+
+def restaurant_slots(restaurant: Restaurant) -> List[time_type]:
+    # كل الفترات القابلة للحجز من وقت الفتح حتى قبل الإغلاق
+    slots = []
+    current = datetime.combine(date.today(), restaurant.opens_at)
+    closes = datetime.combine(date.today(), restaurant.closes_at)
+    while current < closes:
+        slots.append(current.time())
+        current += timedelta(minutes=SLOT_MINUTES)
+    return slots
+
+
+@app.get("/availability/slots")
+@limiter.limit(AVAILABILITY_LIMIT)
+def check_availability_slots(
+    request: Request,
+    restaurant_id: int = Query(...),
+    start_date: str = Query(...),
+    end_date: Optional[str] = Query(None),
+    db: Session = Depends(get_db)
+):
+    """
+    يرجع المتبقي من السعة لكل فترة بين وقت الفتح والإغلاق لمدى من الأيام،
+    باستعلام تجميعي واحد على جدول الحجوزات.
+    """
+
+    restaurant = db.query(Restaurant).filter(Restaurant.id == restaurant_id).first()
+    if not restaurant:
+        raise HTTPException(status_code=404, detail="Restaurant not found")
+
+    try:
+        first_day = datetime.strptime(start_date, "%Y-%m-%d").date()
+        last_day = datetime.strptime(end_date, "%Y-%m-%d").date() if end_date else first_day
+    except ValueError:
+        raise HTTPException(status_code=400, detail="صيغة التاريخ يجب أن تكون YYYY-MM-DD.")
+
+    if last_day < first_day:
+        raise HTTPException(status_code=400, detail="تاريخ النهاية يجب أن يكون بعد تاريخ البداية.")
+    if (last_day - first_day).days >= MAX_AVAILABILITY_DAYS:
+        raise HTTPException(status_code=400, detail=f"أقصى مدى مسموح هو {MAX_AVAILABILITY_DAYS} يوم.")
+
+    # مجموع الأشخاص المحجوزين لكل (تاريخ، وقت) في المدى المطلوب
+    rows = (
+        db.query(Booking.date, Booking.time, func.sum(Booking.people))
+        .filter(
+            Booking.restaurant_id == restaurant_id,
+            Booking.date.between(first_day, last_day),
+            Booking.status.in_(HELD_STATUSES)
+        )
+        .group_by(Booking.date, Booking.time)
+        .all()
+    )
+    booked = {}
+    for day, at, people in rows:
+        booked[(slot_date(day), at.strftime("%H:%M"))] = int(people or 0)
+
+    now = datetime.now()
+    slots = restaurant_slots(restaurant)
+    days = []
+    current_day = first_day
+    while current_day <= last_day:
+        day_slots = []
+        for at in slots:
+            label = at.strftime("%H:%M")
+            # الفترات الماضية تظهر بدون أماكن متاحة
+            if datetime.combine(current_day, at) <= now:
+                remaining = 0
+            else:
+                remaining = max(restaurant.capacity - booked.get((current_day, label), 0), 0)
+            day_slots.append({"time": label, "remaining": remaining})
+        days.append({"date": current_day.isoformat(), "slots": day_slots})
+        current_day += timedelta(days=1)
+
+    return {
+        "status": "success",
+        "restaurant_id": restaurant_id,
+        "capacity": restaurant.capacity,
+        "days": days
+    }
+
+# تأكيد الحجز بعد الدفع (من صفحة النجاح أو webhook) — آمن للتكرار: البريد يرسل مرة واحدة فقط
+def confirm_booking(db: Session, booking_id: int) -> Optional[Booking]:
+    """
+    يؤكد الحجز بعد الدفع. حجز انتهت مهلته قبل وصول الدفع ربما أخذ غيره مقاعده، فيعاد قبوله
+    تحت قفل المطعم كما في إنشاء الحجز، وإذا امتلأت الفترة يبقى ملغياً ويسترد المبلغ.
+    يرجع الحجز (مؤكداً، أو ملغياً بعد الاسترداد) أو None إذا لم يوجد.
+    """
+    # قفل صف الحجز فقط (بدون JOIN حتى لا يُقفل صف المطعم أيضاً) حتى لا يؤكد طلبان متزامنان نفس الحجز
+    booking = db.query(Booking).filter(Booking.id == booking_id).with_for_update().first()
+    if not booking:
+        return None
+
+    was_cancelled = booking.status == BookingStatus.cancelled
+    if was_cancelled:
+        slot = (booking.restaurant_id, slot_date(booking.date), booking.time)
+        people = booking.people
+        session_id = checkout_session_id(booking.client_secret)
+        # نفس ترتيب الأقفال في القبول وتعديل الحجز (المطعم ثم الحجز) وفي معاملة يبدأها القفل
+        db.rollback()
+        if needs_write_lock(db):
+            db.execute(restaurant_write_lock(slot[0]))
+        capacity = db.scalar(restaurant_lock_query(slot[0]))
+        booking = db.query(Booking).filter(Booking.id == booking_id).with_for_update().one()
+        was_cancelled = booking.status == BookingStatus.cancelled
+        if was_cancelled:
+            booked = db.scalar(held_people_query(*slot, exclude_booking_id=booking_id))
+            if capacity is None or booked + people > capacity:
+                db.commit()
+                print(f"⚠️ Booking {booking_id} was paid after its hold expired and the slot is full; refunding")
+                if session_id:
+                    refund_checkout_session(session_id)
+                return booking
+
+    if booking.status == BookingStatus.confirmed:
+        db.commit()
+        return booking
+
+    # المستخدم والمطعم للإيميل (قراءة عادية بدون قفل صفوفهما)
+    booking = (
+        db.query(Booking)
+        .options(joinedload(Booking.user), joinedload(Booking.restaurant))
+        .filter(Booking.id == booking_id)
+        .one()
+    )
+    booking.status = BookingStatus.confirmed
+    # إيميل التأكيد في نفس معاملة التأكيد: إعادة معالجة الحدث ترى الحجز مؤكداً وتتخطاه، فلا فرصة ثانية للإيميل
+    send_booking_confirmation(
+        user_name=booking.user.fullname,
+        user_email=booking.user.email,
+        booking_id=booking.id,
+        date=booking.date.strftime("%Y-%m-%d"),
+        time=booking.time.strftime("%H:%M"),
+        service_name=booking.restaurant.name,
+        db=db
+    )
+    db.commit()
+    hold_timer.discard(booking_id)
+
+    # المستخدم والمطعم لصفحة النجاح باستعلام واحد بعد فك القفل
+    booking = (
+        db.query(Booking)
+        .options(joinedload(Booking.user), joinedload(Booking.restaurant))
+        .filter(Booking.id == booking_id)
+        .one()
+    )
+
+    # حجز انتهت مهلته ثم دُفع وأعيد قبوله: عاد يشغل مقاعده
+    if was_cancelled:
+        ledger.refresh(db, [(booking.restaurant_id, slot_date(booking.date), booking.time)])
+    invalidate_restaurant_cache(filters=False)
+    return booking
+
+
+def checkout_booking_query(metadata):
+    # الجلسات الجديدة تحمل مرجع الحجز، والقديمة (قبل عمود reference) رقمه مباشرة
+    reference = metadata.get("booking_ref")
+    if reference:
+        return select(Booking.id).where(Booking.reference == reference)
+    booking_id = metadata.get("booking_id")
+    if booking_id:
+        return select(Booking.id).where(Booking.id == int(booking_id))
+    return None
+
+
+# معالجة حدث Stripe في الخلفية بعد الرد على الـ webhook
+def process_stripe_event(event_id: str):
+    db = SessionLocal()
+    try:
+        event = db.get(StripeEvent, event_id)
+        if not event or event.processed_at is not None:
+            return
+        if event.booking_id:
+            confirm_booking(db, event.booking_id)
+        event.processed_at = datetime.utcnow()
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        print(f"⚠️ Failed to process Stripe event {event_id}: {e}")
+    finally:
+        db.close()
+
+
+# إعادة معالجة أحداث Stripe المعلقة: حدث لم يعالج بعد مضي STRIPE_REDRIVE_MIN_AGE_SECONDS على استلامه
+# (أو على آخر محاولة). كل العمليات تشغل المهمة، لكن تحديثاً مشروطاً يحجز كل حدث لعملية واحدة فقط.
+STRIPE_REDRIVE_SECONDS = float(os.getenv("STRIPE_REDRIVE_SECONDS", "60"))
+STRIPE_REDRIVE_MIN_AGE_SECONDS = float(os.getenv("STRIPE_REDRIVE_MIN_AGE_SECONDS", "120"))
+STRIPE_REDRIVE_BATCH_SIZE = int(os.getenv("STRIPE_REDRIVE_BATCH_SIZE", "50"))
+
+
+def redrive_stripe_events():
+    now = datetime.utcnow()
+    # الحد الأدنى للعمر يترك الحدث الجديد لمهمة الخلفية التي أطلقها الـ webhook
+    due = and_(
+        StripeEvent.processed_at.is_(None),
+        func.coalesce(StripeEvent.attempted_at, StripeEvent.received_at) <= now - timedelta(seconds=STRIPE_REDRIVE_MIN_AGE_SECONDS)
+    )
+    db = SessionLocal()
+    try:
+        event_ids = [
+            e for (e,) in db.query(StripeEvent.id).filter(due)
+            .order_by(StripeEvent.received_at).limit(STRIPE_REDRIVE_BATCH_SIZE)
+        ]
+        claimed = [
+            event_id for event_id in event_ids
+            if db.query(StripeEvent).filter(StripeEvent.id == event_id, due)
+            .update({"attempted_at": now}, synchronize_session=False)
+        ]
+        db.commit()
+    finally:
+        db.close()
+
+    for event_id in claimed:
+        process_stripe_event(event_id)
+
+
 # صفحة نجاح الدفع
 @app.get("/booking-success", response_class=HTMLResponse)
 def booking_success(
@@ -1103,30 +1816,23 @@ def booking_success(
     session_id: str = Query(...),
     db: Session = Depends(get_db)
 ):
-    session = stripe.checkout.Session.retrieve(session_id)
-    booking_id = session.metadata.get("booking_id")
+    session = retrieve_checkout_session(session_id)
+    query = checkout_booking_query(session.metadata)
+    booking_id = db.scalar(query) if query is not None else None
 
     if not booking_id:
         return HTMLResponse("<h2>الحجز غير موجود!</h2>")
 
-    booking = db.query(Booking).filter(Booking.id == int(booking_id)).first()
+    try:
+        booking = confirm_booking(db, booking_id)
+    except stripe.error.StripeError as e:
+        # فشل الاسترداد: يعاد مع إعادة معالجة حدث Stripe (بنفس مفتاح idempotency)
+        print(f"❌ Stripe error: {e}")
+        booking = db.get(Booking, booking_id)
     if not booking:
         return HTMLResponse("<h2>الحجز غير موجود!</h2>")
-
     if booking.status != BookingStatus.confirmed:
-        booking.status = BookingStatus.confirmed
-        db.commit()
-        db.refresh(booking)
-
-        # إرسال إيميل تأكيد الحجز
-        send_booking_confirmation(
-            user_name=booking.user.fullname,
-            user_email=booking.user.email,
-            booking_id=booking.id,
-            date=booking.date.strftime("%Y-%m-%d"),
-            time=booking.time.strftime("%H:%M"),
-            service_name=booking.restaurant.name
-        )
+        return HTMLResponse("<h2>انتهت مهلة الحجز قبل الدفع وامتلأ الموعد، سيتم استرداد المبلغ.</h2>")
 
     return templates.TemplateResponse(
     "booking-success.html",
@@ -1142,7 +1848,11 @@ def booking_cancel():
 
 
 @app.post("/stripe/webhook")
-async def stripe_webhook(request: Request, db: Session = Depends(get_db)):
+async def stripe_webhook(
+    request: Request,
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_async_db)
+):
     payload = await request.body()
     sig_header = request.headers.get("stripe-signature")
     endpoint_secret = os.getenv("STRIPE_WEBHOOK_SECRET")
@@ -1164,30 +1874,33 @@ async def stripe_webhook(request: Request, db: Session = Depends(get_db)):
         print(f"⚠️ Webhook error: {e}")
         return {"status": "error"}
 
-    # التعامل مع الدفع الناجح فقط
+    # إعادة إرسال من Stripe لحدث وصل سابقاً: رد فوري بدون لمس الحجوزات
+    if await db.get(StripeEvent, event['id']) is not None:
+        return {"status": "duplicate"}
+
+    # التعامل مع الدفع الناجح فقط، وباقي الأحداث تسجل كمعالجة
+    booking_id = None
     if event['type'] == 'checkout.session.completed':
-        session_obj = event['data']['object']
-        booking_id = session_obj['metadata'].get('booking_id')
-
-        if booking_id:
-            db_booking = db.query(Booking).filter(Booking.id == int(booking_id)).first()
-            if db_booking:
-                # تحديث حالة الحجز
-                db_booking.status = BookingStatus.confirmed
-                db.commit()
-                db.refresh(db_booking)
-
-                # إرسال بريد التأكيد
-                user = db.query(User).filter(User.id == db_booking.user_id).first()
-                if user:
-                    send_booking_confirmation(
-                        user_name=user.fullname,
-                        user_email=user.email,
-                        booking_id=db_booking.id,
-                        date=db_booking.date.strftime("%Y-%m-%d"),
-                        time=db_booking.time.strftime("%H:%M"),
-                        service_name=db_booking.restaurant.name
-                    )
+        query = checkout_booking_query(event['data']['object']['metadata'])
+        if query is not None:
+            booking_id = await db.scalar(query)
+
+    db.add(StripeEvent(
+        id=event['id'],
+        type=event['type'],
+        booking_id=booking_id,
+        processed_at=None if booking_id else datetime.utcnow()
+    ))
+    try:
+        await db.commit()
+    except IntegrityError:
+        # نفس الحدث وصل في طلب متزامن آخر
+        await db.rollback()
+        return {"status": "duplicate"}
+
+    # تأكيد الحجز وإرسال البريد بعد الرد حتى يبقى زمن الـ webhook قصيراً
+    if booking_id:
+        background_tasks.add_task(process_stripe_event, event['id'])
 
     return {"status": "success"}
 
@@ -1209,15 +1922,6 @@ async def create_checkout_session():
     )
     return JSONResponse({"clientSecret": session.client_secret})
 
-@app.delete("/api/bookings/cleanup")
-def cleanup_expired_bookings(db: Session = Depends(get_db)):
-    expiration = datetime.utcnow() - timedelta(minutes=2)
-    deleted_count = db.query(Booking).filter(
-        Booking.status == BookingStatus.pending,
-        Booking.created_at < expiration
-    ).delete(synchronize_session=False)
-    db.commit()
-    return {"deleted": deleted_count}
 
 
 
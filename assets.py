@@ -0,0 +1,88 @@
+# assets.py - ملفات static ببصمة محتوى ونسخ مضغوطة مسبقاً (gzip/brotli) مع تخزين دائم في المتصفح
+#
+# البناء: python -m scripts.build_assets  (يكتب static/dist/ و manifest.json)
+# بدون بناء تعمل الروابط العادية /static/... كما هي.
+import json
+import os
+from mimetypes import guess_type
+
+from anyio import to_thread
+from fastapi.staticfiles import StaticFiles
+from starlette.datastructures import Headers
+
+STATIC_DIR = "static"
+DIST_DIR = "dist"
+MANIFEST_PATH = os.path.join(STATIC_DIR, DIST_DIR, "manifest.json")
+
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+# الملفات بدون بصمة: يتحقق المتصفح كل مرة عبر ETag (استجابة 304 بدون جسم)
+REVALIDATE_CACHE = "no-cache"
+
+# ترتيب التفضيل عند قبول العميل للاثنين
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+
+def load_manifest(path: str = MANIFEST_PATH) -> dict:
+    # المسار الأصلي (js/lang.js) -> المسار ببصمة (dist/js/lang.3f2a9c1d0b.js)
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+manifest = load_manifest()
+fingerprinted = set(manifest.values())
+
+
+def asset_url(path: str) -> str:
+    # دالة Jinja: {{ asset_url('style.css') }}
+    return f"/{STATIC_DIR}/{manifest.get(path, path)}"
+
+
+def accepted_encodings(header: str) -> set:
+    accepted = set()
+    for part in header.split(","):
+        coding, _, params = part.strip().partition(";")
+        q = params.strip()
+        if q.startswith("q="):
+            try:
+                if float(q[2:]) == 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.add(coding.strip().lower())
+    return accepted
+
+
+class PrecompressedStaticFiles(StaticFiles):
+    """
+    يرسل النسخة المضغوطة مسبقاً (.br أو .gz) إذا قبلها العميل بدل الضغط عند كل طلب،
+    مع Cache-Control: immutable للملفات ذات البصمة.
+    """
+
+    async def get_response(self, path: str, scope):
+        asset = path.replace(os.sep, "/")
+        if asset not in fingerprinted:
+            response = await super().get_response(path, scope)
+            response.headers.setdefault("Cache-Control", REVALIDATE_CACHE)
+            return response
+
+        accepted = accepted_encodings(Headers(scope=scope).get("accept-encoding", ""))
+        response = None
+        for encoding, suffix in ENCODINGS:
+            if encoding not in accepted:
+                continue
+            full_path, stat_result = await to_thread.run_sync(self.lookup_path, path + suffix)
+            if stat_result is not None:
+                response = self.file_response(full_path, stat_result, scope)
+                if response.status_code == 200:
+                    response.headers["Content-Type"] = guess_type(asset)[0] or "application/octet-stream"
+                response.headers["Content-Encoding"] = encoding
+                break
+
+        if response is None:
+            response = await super().get_response(path, scope)
+        response.headers["Cache-Control"] = IMMUTABLE_CACHE
+        response.headers["Vary"] = "Accept-Encoding"
+        return response
@@ -0,0 +1,385 @@
+# bench/booking_flow.py - اختبار حمل لمسار الحجز كاملاً مع فحص حدود السعة
+#
+# التشغيل من جذر المشروع (SQLite محلي افتراضياً، أو MySQL عبر DATABASE_URL/ASYNC_DATABASE_URL):
+#   python -m bench.booking_flow
+#   python -m bench.booking_flow --concurrency 50 --seconds 15 --restaurants 200 --bookings 50000
+#   python -m bench.booking_flow --save bench_baseline.json
+#   python -m bench.booking_flow --baseline bench_baseline.json      # مقارنة مع قياس سابق
+#
+# تنبيه: البذر يحذف الجداول ويعيد إنشاءها، فاستخدم قاعدة بيانات مخصصة للقياس.
+#
+# الخطوات:
+#   1. بذر N مطاعم ومستخدمين وحجوزات (وأدمن واحد)
+#   2. تشغيل Stripe وهمي (scripts/mock_stripe) والتطبيق عبر uvicorn
+#   3. تسجيل دخول عميل لكل مستخدم افتراضي، ثم الضغط على كل مسار لمدة --seconds
+#      وطباعة p50/p95/p99 والإنتاجية وتوزيع رموز الاستجابة
+#   4. تزاحم على فترة واحدة ثم التحقق من أن المقبول لا يتجاوز السعة (في الردود وفي قاعدة البيانات)
+# يخرج بالرمز 1 إذا فشل أي فحص للسعة أو رد طلب في التزاحم بخطأ خادم (صالح كخطوة في CI).
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from collections import Counter
+from datetime import date, time as time_type, timedelta
+
+DB_FILE = "bench_booking_flow.db"
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{DB_FILE}")
+os.environ.setdefault("ASYNC_DATABASE_URL", f"sqlite+aiosqlite:///{DB_FILE}")
+# البريد يبقى في صندوق الصادر، وحد المحاولات يمنع قياس /login
+os.environ.setdefault("EMAIL_WORKER", "0")
+os.environ.setdefault("RATE_LIMIT_ENABLED", "0")
+
+from sqlalchemy import func
+
+from db import Base, SessionLocal, engine
+from models import Booking, BookingStatus, Restaurant, User
+from capacity import HELD_STATUSES
+from passwords import hash_password
+
+PASSWORD = "bench-password"
+OPENS_AT = 12
+CLOSES_AT = 23
+CAPACITY = 40
+BOOKING_DAYS = 14
+# يوم بدون حجوزات مبذورة لفحص التزاحم
+CONTENTION_DAY = date.today() + timedelta(days=BOOKING_DAYS + 7)
+CONTENTION_TIME = "19:00"
+AREAS = [("الرياض", "Riyadh"), ("جدة", "Jeddah"), ("الدمام", "Dammam")]
+CUISINES = [("مأكولات بحرية", "Seafood"), ("إيطالي", "Italian"), ("شعبي", "Saudi")]
+
+
+def seed(restaurants: int, users: int, bookings: int):
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    rng = random.Random(42)
+    # تشفير واحد لكل المستخدمين: bcrypt مكلف والقياس لا يحتاج كلمات مرور مختلفة
+    hashed = hash_password(PASSWORD)
+
+    db = SessionLocal()
+    try:
+        db.bulk_insert_mappings(Restaurant, [
+            {
+                "id": i + 1,
+                "name": f"مطعم {i}", "name_en": f"Restaurant {i}",
+                "area": AREAS[i % 3][0], "area_en": AREAS[i % 3][1],
+                "cuisine": CUISINES[i % 3][0], "cuisine_en": CUISINES[i % 3][1],
+                "opens_at": time_type(OPENS_AT), "closes_at": time_type(CLOSES_AT),
+                "capacity": CAPACITY,
+            } for i in range(restaurants)
+        ])
+        db.bulk_insert_mappings(User, [
+            {"id": i + 1, "fullname": f"User {i}", "email": f"user{i}@bench.local", "password": hashed, "role": "user"}
+            for i in range(users)
+        ] + [
+            {"id": users + 1, "fullname": "Admin", "email": "admin@bench.local", "password": hashed, "role": "admin"}
+        ])
+
+        # حجوزات مؤكدة موزعة عشوائياً بدون تجاوز سعة أي فترة
+        held = Counter()
+        rows = []
+        for _ in range(bookings):
+            restaurant_id = rng.randint(1, restaurants)
+            day = date.today() + timedelta(days=rng.randrange(BOOKING_DAYS))
+            at = time_type(rng.randrange(OPENS_AT, CLOSES_AT))
+            people = rng.randint(1, 4)
+            if held[(restaurant_id, day, at)] + people > CAPACITY:
+                continue
+            held[(restaurant_id, day, at)] += people
+            rows.append({
+                "restaurant_id": restaurant_id, "user_id": rng.randint(1, users),
+                "date": day, "time": at, "people": people, "status": BookingStatus.confirmed,
+            })
+        db.bulk_insert_mappings(Booking, rows)
+        db.commit()
+        print(f"seeded {restaurants} restaurants, {users} users, {len(rows)} bookings into {engine.url.drivername}")
+    finally:
+        db.close()
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * pct / 100), len(ordered) - 1)] if ordered else 0.0
+
+
+def random_day(rng) -> str:
+    return (date.today() + timedelta(days=rng.randrange(BOOKING_DAYS))).isoformat()
+
+
+def random_time(rng) -> str:
+    return f"{rng.randrange(OPENS_AT, CLOSES_AT):02d}:00"
+
+
+def scenarios(restaurants: int):
+    # كل سيناريو: (العميل، مولد عشوائي) -> طلب واحد
+    def get_restaurants(client, rng):
+        params = {"lang": rng.choice(["ar", "en"]), "limit": 20}
+        if rng.random() < 0.3:
+            params["search"] = rng.choice(["مطعم", "restaurant", "بحري", "italian"])
+        return client.get("/restaurants", params=params)
+
+    def availability(client, rng):
+        return client.get("/availability", params={
+            "restaurant_id": rng.randint(1, restaurants), "date": random_day(rng), "time": random_time(rng)
+        })
+
+    def availability_slots(client, rng):
+        return client.get("/availability/slots", params={
+            "restaurant_id": rng.randint(1, restaurants), "start_date": random_day(rng)
+        })
+
+    def login(client, rng):
+        # كل عميل يسجل دخول بمستخدمه حتى لا تبطل جلسات العملاء الآخرين
+        return client.post("/login", json={"email": client.bench_email, "password": PASSWORD})
+
+    def create_booking(client, rng):
+        return client.post("/bookings", json={
+            "lang": "ar", "restaurant_id": rng.randint(1, restaurants),
+            "date": random_day(rng), "time": random_time(rng), "people": rng.randint(1, 2)
+        })
+
+    def user_bookings(client, rng):
+        return client.get("/api/bookings", params={"lang": "ar"})
+
+    def admin_bookings(client, rng):
+        return client.bench_admin.get("/api/admin/bookings", params={"lang": "ar", "limit": 50})
+
+    return {
+        "restaurants": get_restaurants,
+        "availability": availability,
+        "availability_slots": availability_slots,
+        "login": login,
+        "create_booking": create_booking,
+        "user_bookings": user_bookings,
+        "admin_bookings": admin_bookings,
+    }
+
+
+async def drive(clients, make_request, concurrency: int, seconds: float):
+    latencies = []
+    statuses = Counter()
+    deadline = time.perf_counter() + seconds
+
+    async def worker(index):
+        client = clients[index % len(clients)]
+        rng = random.Random(index)
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                res = await make_request(client, rng)
+                statuses[res.status_code] += 1
+            except Exception as e:
+                statuses[type(e).__name__] += 1
+                continue
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    ok = sum(count for status, count in statuses.items() if isinstance(status, int) and status < 300)
+    return {
+        "requests": sum(statuses.values()),
+        "ok": ok,
+        "throughput": round(ok / elapsed, 1),
+        "p50": round(percentile(latencies, 50), 2),
+        "p95": round(percentile(latencies, 95), 2),
+        "p99": round(percentile(latencies, 99), 2),
+        "statuses": {str(status): count for status, count in sorted(statuses.items(), key=str)},
+    }
+
+
+async def login_clients(base_url: str, count: int):
+    import httpx
+
+    limits = httpx.Limits(max_connections=count + 10)
+    admin = httpx.AsyncClient(base_url=base_url, timeout=60, limits=limits)
+    res = await admin.post("/login", json={"email": "admin@bench.local", "password": PASSWORD})
+    res.raise_for_status()
+
+    clients = []
+    for i in range(count):
+        client = httpx.AsyncClient(base_url=base_url, timeout=60)
+        client.bench_email = f"user{i}@bench.local"
+        client.bench_admin = admin
+        clients.append(client)
+    results = await asyncio.gather(*(
+        c.post("/login", json={"email": c.bench_email, "password": PASSWORD}) for c in clients
+    ))
+    for res in results:
+        res.raise_for_status()
+    return clients, admin
+
+
+async def contention(clients, attempts: int, people: int):
+    """
+    طلبات متزامنة على نفس الفترة أكثر من سعتها. يرجع عدد المقاعد المقبولة في الردود.
+    """
+    async def attempt(client):
+        res = await client.post("/bookings", json={
+            "lang": "ar", "restaurant_id": 1, "date": CONTENTION_DAY.isoformat(),
+            "time": CONTENTION_TIME, "people": people
+        })
+        return res.status_code
+
+    statuses = Counter(await asyncio.gather(*(attempt(clients[i % len(clients)]) for i in range(attempts))))
+    accepted = sum(count for status, count in statuses.items() if status < 300) * people
+    return accepted, statuses
+
+
+def check_capacity(accepted_seats: int) -> list:
+    failures = []
+    db = SessionLocal()
+    try:
+        slot_seats = db.query(func.coalesce(func.sum(Booking.people), 0)).filter(
+            Booking.restaurant_id == 1,
+            Booking.date == CONTENTION_DAY,
+            Booking.time == time_type(19, 0),
+            Booking.status.in_(HELD_STATUSES)
+        ).scalar()
+
+        # كل الفترات: مجموع المقاعد المحجوزة لا يتجاوز سعة المطعم
+        oversold = (
+            db.query(Booking.restaurant_id, Booking.date, Booking.time, func.sum(Booking.people))
+            .join(Restaurant, Restaurant.id == Booking.restaurant_id)
+            .filter(Booking.status.in_(HELD_STATUSES))
+            .group_by(Booking.restaurant_id, Booking.date, Booking.time, Restaurant.capacity)
+            .having(func.sum(Booking.people) > Restaurant.capacity)
+            .all()
+        )
+    finally:
+        db.close()
+
+    if accepted_seats > CAPACITY:
+        failures.append(f"accepted {accepted_seats} seats for a slot with capacity {CAPACITY}")
+    if slot_seats > CAPACITY:
+        failures.append(f"database holds {slot_seats} seats for a slot with capacity {CAPACITY}")
+    if slot_seats != accepted_seats:
+        failures.append(f"database holds {slot_seats} seats but responses accepted {accepted_seats}")
+    if oversold:
+        failures.append(f"{len(oversold)} oversold slots, e.g. {oversold[:3]}")
+    print(f"contention slot: accepted={accepted_seats} in_db={slot_seats} capacity={CAPACITY} oversold_slots={len(oversold)}")
+    return failures
+
+
+def wait_for(url: str, timeout=30):
+    import httpx
+
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            httpx.get(url, timeout=1)
+            return
+        except Exception:
+            time.sleep(0.2)
+    raise RuntimeError(f"{url} did not start")
+
+
+def print_report(results: dict, baseline: dict):
+    for name, r in results.items():
+        line = (
+            f"{name:<19} {r['throughput']:8.1f} req/s  p50={r['p50']:7.1f}ms p95={r['p95']:7.1f}ms "
+            f"p99={r['p99']:7.1f}ms  {r['statuses']}"
+        )
+        base = baseline.get(name)
+        if base:
+            line += (
+                f"\n{'':<19} vs baseline: throughput {r['throughput'] - base['throughput']:+.1f} req/s, "
+                f"p95 {r['p95'] - base['p95']:+.1f}ms, p99 {r['p99'] - base['p99']:+.1f}ms"
+            )
+        print(line)
+
+
+async def run(args):
+    base_url = f"http://127.0.0.1:{args.port}"
+    clients, admin = await login_clients(base_url, args.concurrency)
+    try:
+        all_scenarios = scenarios(args.restaurants)
+        selected = args.only.split(",") if args.only else list(all_scenarios)
+        results = {}
+        for name in selected:
+            results[name] = await drive(clients, all_scenarios[name], args.concurrency, args.seconds)
+            print(f"  {name} done")
+
+        accepted, statuses = await contention(clients, args.contention, people=2)
+        print(f"contention responses: {dict(statuses)}")
+        return results, accepted, statuses
+    finally:
+        await asyncio.gather(*(c.aclose() for c in clients), admin.aclose())
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--restaurants", type=int, default=50)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--bookings", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--contention", type=int, default=100, help="concurrent bookings on one slot")
+    parser.add_argument("--stripe-latency-ms", type=float, default=300)
+    parser.add_argument("--only", help="comma separated scenarios, e.g. restaurants,create_booking")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--stripe-port", type=int, default=12112)
+    parser.add_argument("--save", help="write results as JSON (a baseline for later runs)")
+    parser.add_argument("--baseline", help="compare with results saved by --save")
+    args = parser.parse_args()
+    # كل عميل مستخدم مختلف
+    args.users = max(args.users, args.concurrency)
+
+    seed(args.restaurants, args.users, args.bookings)
+
+    env = dict(
+        os.environ,
+        STRIPE_API_BASE=f"http://127.0.0.1:{args.stripe_port}",
+        STRIPE_SECRET_KEY="sk_test_bench",
+        BASE_URL=f"http://127.0.0.1:{args.port}",
+    )
+    stripe_mock = subprocess.Popen([
+        sys.executable, "-m", "scripts.mock_stripe",
+        "--port", str(args.stripe_port), "--latency-ms", str(args.stripe_latency_ms)
+    ])
+    server = subprocess.Popen([
+        sys.executable, "-m", "uvicorn", "app:app",
+        "--port", str(args.port), "--workers", str(args.workers), "--log-level", "warning"
+    ], env=env)
+    try:
+        wait_for(f"http://127.0.0.1:{args.port}/ok")
+        print(
+            f"workers={args.workers} concurrency={args.concurrency} seconds={args.seconds} "
+            f"stripe_latency={args.stripe_latency_ms}ms db={engine.url.drivername}"
+        )
+        results, accepted, statuses = asyncio.run(run(args))
+    finally:
+        server.terminate()
+        stripe_mock.terminate()
+        server.wait()
+        stripe_mock.wait()
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+    print_report(results, baseline)
+
+    failures = check_capacity(accepted)
+    # خطأ خادم أثناء التزاحم (مثلاً database is locked) يخفي طلبات لم يختبر قبولها
+    errors = sum(count for status, count in statuses.items() if status >= 500)
+    if errors:
+        failures.append(f"{errors} contention requests failed with a server error")
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({"args": vars(args), "results": results, "capacity_failures": failures}, f, indent=2)
+
+    if failures:
+        for failure in failures:
+            print(f"FAIL {failure}")
+        sys.exit(1)
+    print("capacity invariants OK")
+
+
+if __name__ == "__main__":
+    main()
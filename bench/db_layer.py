@@ -0,0 +1,135 @@
+# bench/db_layer.py - مقارنة الإنتاجية: async def مع Session متزامنة مقابل AsyncSession
+#
+# التشغيل من جذر المشروع (SQLite محلي افتراضياً، أو MySQL عبر DATABASE_URL/ASYNC_DATABASE_URL):
+#   python -m bench.db_layer --workers 2 --concurrency 50 --seconds 10
+#   DATABASE_URL=mysql+pymysql://u:p@127.0.0.1/bench ASYNC_DATABASE_URL=mysql+aiomysql://u:p@127.0.0.1/bench \
+#       python -m bench.db_layer --workers 4
+#
+# يشغل uvicorn بنفس عدد الـ workers لكل وضع، ويضغط على مسارين يطابقان شكل login_user:
+#   /sync/user   async def + db.query (الشكل القديم: يوقف حلقة الأحداث)
+#   /async/user  async def + await db.scalar (get_async_db)
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+
+os.environ.setdefault("DATABASE_URL", "sqlite:///bench_db_layer.db")
+os.environ.setdefault("ASYNC_DATABASE_URL", "sqlite+aiosqlite:///bench_db_layer.db")
+
+from fastapi import Depends, FastAPI
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from db import Base, SessionLocal, engine, get_async_db, get_db
+from models import User
+
+USERS = 1000
+
+app = FastAPI()
+
+
+@app.get("/sync/user/{n}")
+async def sync_user(n: int, db: Session = Depends(get_db)):
+    user = db.query(User).filter(User.email == f"user{n % USERS}@bench.local").first()
+    return {"id": user.id if user else None}
+
+
+@app.get("/async/user/{n}")
+async def async_user(n: int, db: AsyncSession = Depends(get_async_db)):
+    user = await db.scalar(select(User).where(User.email == f"user{n % USERS}@bench.local"))
+    return {"id": user.id if user else None}
+
+
+def seed():
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        if db.query(User).count() >= USERS:
+            return
+        db.add_all(
+            User(fullname=f"User {i}", email=f"user{i}@bench.local", password="x", role="user")
+            for i in range(USERS)
+        )
+        db.commit()
+    finally:
+        db.close()
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * pct / 100), len(ordered) - 1)] if ordered else 0.0
+
+
+async def drive(url: str, concurrency: int, seconds: float):
+    import httpx
+
+    latencies = []
+    errors = 0
+    deadline = time.perf_counter() + seconds
+
+    async with httpx.AsyncClient(base_url=url, timeout=30) as client:
+        async def worker(offset):
+            nonlocal errors
+            n = offset
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                try:
+                    res = await client.get(f"{n}")
+                    res.raise_for_status()
+                    latencies.append((time.perf_counter() - start) * 1000)
+                except Exception:
+                    errors += 1
+                n += concurrency
+
+        await asyncio.gather(*(worker(i) for i in range(concurrency)))
+
+    return latencies, errors
+
+
+def wait_for(port: int, timeout=20):
+    import httpx
+
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/sync/user/0", timeout=1)
+            return
+        except Exception:
+            time.sleep(0.2)
+    raise RuntimeError("server did not start")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    seed()
+    server = subprocess.Popen([
+        sys.executable, "-m", "uvicorn", "bench.db_layer:app",
+        "--port", str(args.port), "--workers", str(args.workers), "--log-level", "warning"
+    ])
+    try:
+        wait_for(args.port)
+        print(f"workers={args.workers} concurrency={args.concurrency} seconds={args.seconds} db={engine.url.drivername}")
+        for mode in ("sync", "async"):
+            url = f"http://127.0.0.1:{args.port}/{mode}/user/"
+            latencies, errors = asyncio.run(drive(url, args.concurrency, args.seconds))
+            print(
+                f"{mode:<6} {len(latencies) / args.seconds:8.1f} req/s "
+                f"p50={percentile(latencies, 50):6.1f}ms p95={percentile(latencies, 95):6.1f}ms "
+                f"p99={percentile(latencies, 99):6.1f}ms errors={errors}"
+            )
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+# bench/login_storm.py - زمن استجابة حلقة الأحداث أثناء موجة تسجيلات دخول
+#
+# التشغيل من جذر المشروع:
+#   python -m bench.login_storm                    # مقارنة داخلية: bcrypt مباشر مقابل thread pool
+#   python -m bench.login_storm --logins 50 --rounds 12
+#   python -m bench.login_storm --url http://127.0.0.1:8000 --email a@b.c --password secret
+#
+# الوضع الداخلي يشغل "طلبات أخرى" (تأخير 10ms) بجانب N عمليات تحقق من كلمة المرور،
+# ويقيس كم تتأخر هذه الطلبات عن موعدها. وضع --url يقيس /ok على خادم يعمل فعلاً
+# بينما يرسل N طلبات /login متزامنة.
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = min(int(len(ordered) * pct / 100), len(ordered) - 1)
+    return ordered[index]
+
+
+def report(label, lags_ms, elapsed):
+    print(
+        f"{label:<10} other-request lag: p50={percentile(lags_ms, 50):7.1f}ms "
+        f"p99={percentile(lags_ms, 99):7.1f}ms max={max(lags_ms or [0]):7.1f}ms "
+        f"| storm finished in {elapsed:.2f}s"
+    )
+
+
+async def probe(stop: asyncio.Event, lags: list, interval=0.01):
+    # يمثل باقي الطلبات: يفترض أن يستيقظ كل 10ms
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append((time.perf_counter() - start - interval) * 1000)
+
+
+async def run_local(mode: str, logins: int, hashed: str):
+    import passwords
+
+    async def login():
+        if mode == "inline":
+            passwords.verify_password("correct horse", hashed)
+        else:
+            await passwords.verify_password_async("correct horse", hashed)
+
+    stop = asyncio.Event()
+    lags = []
+    prober = asyncio.create_task(probe(stop, lags))
+    await asyncio.sleep(0.1)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(login() for _ in range(logins)))
+    elapsed = time.perf_counter() - start
+
+    stop.set()
+    await prober
+    report(mode, lags, elapsed)
+
+
+async def run_remote(url: str, logins: int, email: str, password: str):
+    import httpx
+
+    async with httpx.AsyncClient(base_url=url, timeout=60) as client:
+        stop = asyncio.Event()
+        latencies = []
+
+        async def sample_ok():
+            while not stop.is_set():
+                start = time.perf_counter()
+                await client.get("/ok")
+                latencies.append((time.perf_counter() - start) * 1000)
+                await asyncio.sleep(0.01)
+
+        sampler = asyncio.create_task(sample_ok())
+        await asyncio.sleep(0.5)
+        baseline = list(latencies)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(
+            client.post("/login", json={"email": email, "password": password})
+            for _ in range(logins)
+        ))
+        elapsed = time.perf_counter() - start
+
+        stop.set()
+        await sampler
+
+    storm = latencies[len(baseline):]
+    print(f"/ok idle      p50={percentile(baseline, 50):7.1f}ms p99={percentile(baseline, 99):7.1f}ms")
+    print(f"/ok in storm  p50={percentile(storm, 50):7.1f}ms p99={percentile(storm, 99):7.1f}ms "
+          f"max={max(storm or [0]):7.1f}ms | {logins} logins in {elapsed:.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--logins", type=int, default=20)
+    parser.add_argument("--rounds", type=int, default=None, help="bcrypt cost (default BCRYPT_ROUNDS)")
+    parser.add_argument("--url", default=None)
+    parser.add_argument("--email", default=None)
+    parser.add_argument("--password", default=None)
+    args = parser.parse_args()
+
+    if args.url:
+        asyncio.run(run_remote(args.url, args.logins, args.email, args.password))
+        return
+
+    if args.rounds:
+        os.environ["BCRYPT_ROUNDS"] = str(args.rounds)
+    import passwords
+
+    hashed = passwords.hash_password("correct horse")
+    print(f"bcrypt cost={passwords.BCRYPT_ROUNDS} workers={passwords.BCRYPT_WORKERS} logins={args.logins}")
+    asyncio.run(run_local("inline", args.logins, hashed))
+    asyncio.run(run_local("pool", args.logins, hashed))
+
+
+if __name__ == "__main__":
+    main()
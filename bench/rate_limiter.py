@@ -0,0 +1,136 @@
+# bench/rate_limiter.py - كم يضيف فحص حدود الطلبات لكل طلب
+#
+# التشغيل من جذر المشروع:
+#   python -m bench.rate_limiter
+#   python -m bench.rate_limiter --storage redis://127.0.0.1:6379 --requests 5000
+#
+# "storage": استدعاء hit() للاستراتيجية مباشرة (عمل المكتبة + ذهاب وإياب للتخزين)
+# "asgi": طلب GET كامل عبر SlowAPIMiddleware ومسار عليه @limiter.limit، مقابل نفس التطبيق والحدود معطلة.
+# الفرق بين الاثنين في وضع asgi هو ما يدفعه كل طلب فعلاً بسبب الحدود.
+import argparse
+import asyncio
+import statistics
+import time
+import uuid
+
+from fastapi import FastAPI, Request
+from limits import parse
+from limits.storage import storage_from_string
+from limits.strategies import STRATEGIES
+from slowapi.middleware import SlowAPIMiddleware
+
+from ratelimit import RATE_LIMIT_STRATEGY, create_limiter
+
+# حد كبير حتى لا يرفض أي طلب أثناء القياس
+BENCH_LIMIT = "1000000/minute"
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(int(len(ordered) * pct / 100), len(ordered) - 1)
+    return ordered[index]
+
+
+def report(label, timings_us):
+    print(
+        f"{label:<34} p50={percentile(timings_us, 50):8.1f}us  p99={percentile(timings_us, 99):8.1f}us  "
+        f"mean={statistics.fmean(timings_us):8.1f}us"
+    )
+
+
+def bench_storage(uri, requests, clients):
+    storage = storage_from_string(uri)
+    item = parse(BENCH_LIMIT)
+    # مفاتيح خاصة بهذا التشغيل حتى لا تختلط بعدادات حقيقية على Redis مشترك (تنتهي وحدها بعد دقيقة)
+    run = uuid.uuid4().hex[:8]
+    for name in ("fixed-window", "moving-window", "sliding-window-counter"):
+        if name not in STRATEGIES:
+            continue
+        strategy = STRATEGIES[name](storage)
+        timings = []
+        for i in range(requests):
+            key = f"bench-{run}-{i % clients}"
+            start = time.perf_counter()
+            strategy.hit(item, key)
+            timings.append((time.perf_counter() - start) * 1e6)
+        report(f"storage {name}", timings)
+
+
+def make_app(uri, strategy, enabled):
+    limiter = create_limiter(storage_uri=uri, strategy=strategy, enabled=enabled)
+    app = FastAPI()
+    app.state.limiter = limiter
+    app.add_middleware(SlowAPIMiddleware)
+
+    # async حتى لا يغطي تذبذب الـ threadpool على الفرق المقاس
+    @app.get("/availability")
+    @limiter.limit(BENCH_LIMIT)
+    async def availability(request: Request):
+        return {"status": "success"}
+
+    return app
+
+
+async def call(app, client_ip):
+    status = None
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": "GET", "scheme": "http", "path": "/availability", "raw_path": b"/availability",
+        "root_path": "", "query_string": b"", "headers": [(b"host", b"bench")],
+        "client": (client_ip, 50000), "server": ("bench", 80),
+    }
+    await app(scope, receive, send)
+    return status
+
+
+async def bench_asgi(app, requests, clients):
+    # إحماء: بناء طبقات الـ middleware وأول اتصال بالتخزين
+    for i in range(50):
+        await call(app, f"10.0.0.{i % clients}")
+
+    timings = []
+    for i in range(requests):
+        start = time.perf_counter()
+        status = await call(app, f"10.0.{i % clients // 256}.{i % clients % 256}")
+        timings.append((time.perf_counter() - start) * 1e6)
+        assert status == 200, status
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--storage", default="memory://")
+    parser.add_argument("--strategy", default=RATE_LIMIT_STRATEGY)
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--clients", type=int, default=500)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"storage={args.storage} strategy={args.strategy} {args.requests} requests from {args.clients} clients")
+    bench_storage(args.storage, args.requests, args.clients)
+
+    # جولات متناوبة حتى لا يظلم تسخين المعالج أو الـ GC أحد الطرفين
+    disabled_app = make_app(args.storage, args.strategy, False)
+    enabled_app = make_app(args.storage, args.strategy, True)
+    baseline, limited = [], []
+    per_round = max(args.requests // args.rounds, 1)
+    for _ in range(args.rounds):
+        baseline += asyncio.run(bench_asgi(disabled_app, per_round, args.clients))
+        limited += asyncio.run(bench_asgi(enabled_app, per_round, args.clients))
+    report("asgi limiter disabled", baseline)
+    report("asgi limiter enabled", limited)
+    added = statistics.median(limited) - statistics.median(baseline)
+    print(f"added per request (p50): {added:.1f}us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+# bench/serializers.py - مقارنة تحويل قوائم المطاعم والحجوزات إلى JSON
+#
+# التشغيل من جذر المشروع:
+#   python -m bench.serializers
+#   python -m bench.serializers --rows 10000 --repeat 5
+#
+# "legacy": قواميس يدوية + strftime/isoformat + jsonable_encoder + json.dumps (مثل JSONResponse)
+# "orjson": serializers.py مجهزة لكل لغة + orjson.dumps مباشرة إلى bytes
+import argparse
+import json
+import statistics
+import time
+from datetime import date, datetime, time as time_type, timedelta
+from types import SimpleNamespace
+
+from fastapi.encoders import jsonable_encoder
+
+from models import BookingStatus
+from serializers import dumps, restaurant_serializer, user_booking_serializer
+
+
+def make_rows(count: int):
+    created = datetime(2025, 1, 1, 12, 30, 15, 123456)
+    restaurants = []
+    bookings = []
+    for i in range(count):
+        r = SimpleNamespace(
+            id=i,
+            name=f"مطعم رقم {i}", name_en=f"Restaurant {i}",
+            area="الرياض", area_en="Riyadh",
+            cuisine="مأكولات بحرية", cuisine_en="Seafood" if i % 3 else None,
+            opens_at=time_type(9, 0), closes_at=time_type(23, 30),
+            capacity=40,
+            created_at=created + timedelta(minutes=i), updated_at=created + timedelta(minutes=i)
+        )
+        restaurants.append(r)
+        bookings.append(SimpleNamespace(
+            id=i, restaurant=r,
+            date=date(2025, 2, 1) + timedelta(days=i % 30), time=time_type(19, 0),
+            people=2 + i % 4,
+            status=BookingStatus.pending if i % 5 == 0 else BookingStatus.confirmed,
+            client_secret=f"cs_test_{i}",
+            created_at=created, updated_at=created
+        ))
+    return restaurants, bookings
+
+
+def legacy_render(content) -> bytes:
+    # نفس ما تفعله FastAPI مع dict عادي: jsonable_encoder ثم JSONResponse.render
+    return json.dumps(
+        jsonable_encoder(content), ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")
+    ).encode("utf-8")
+
+
+def legacy_restaurants(restaurants, lang):
+    return legacy_render({"status": "success", "data": [
+        {
+            "id": r.id,
+            "name": r.name if lang == "ar" else r.name_en or r.name,
+            "area": r.area if lang == "ar" else r.area_en or r.area,
+            "cuisine": r.cuisine if lang == "ar" else r.cuisine_en or r.cuisine,
+            "opens_at": r.opens_at.strftime("%H:%M"),
+            "closes_at": r.closes_at.strftime("%H:%M"),
+            "capacity": r.capacity,
+            "today_bookings": 0,
+            "created_at": r.created_at.isoformat(),
+            "updated_at": r.updated_at.isoformat()
+        } for r in restaurants
+    ]})
+
+
+def legacy_bookings(bookings, lang):
+    data = []
+    for b in bookings:
+        item = {
+            "id": b.id,
+            "restaurant_name": b.restaurant.name_en if lang == "en" else b.restaurant.name,
+            "date": b.date.isoformat(),
+            "time": b.time.strftime("%H:%M"),
+            "people": b.people,
+            "status": b.status,
+            "created_at": b.created_at.isoformat(),
+            "updated_at": b.updated_at.isoformat()
+        }
+        if b.status == BookingStatus.pending:
+            item["client_secret"] = b.client_secret
+        data.append(item)
+    return legacy_render({"status": "success", "data": data})
+
+
+def orjson_restaurants(restaurants, lang):
+    serialize = restaurant_serializer(lang)
+    data = []
+    for r in restaurants:
+        item = serialize(r)
+        item["today_bookings"] = 0
+        data.append(item)
+    return dumps({"status": "success", "data": data})
+
+
+def orjson_bookings(bookings, lang):
+    serialize = user_booking_serializer(lang)
+    return dumps({"status": "success", "data": [serialize(b) for b in bookings]})
+
+
+def measure(fn, rows, lang, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        body = fn(rows, lang)
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings), len(body)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    restaurants, bookings = make_rows(args.rows)
+    cases = [
+        ("restaurants", restaurants, legacy_restaurants, orjson_restaurants),
+        ("bookings", bookings, legacy_bookings, orjson_bookings),
+    ]
+    print(f"{args.rows} rows, median of {args.repeat} runs")
+    for label, rows, legacy, fast in cases:
+        for lang in ("ar", "en"):
+            # نفس المحتوى بعد فك الترميز
+            assert json.loads(legacy(rows[:50], lang)) == json.loads(fast(rows[:50], lang)), (label, lang)
+
+            legacy_ms, legacy_size = measure(legacy, rows, lang, args.repeat)
+            fast_ms, fast_size = measure(fast, rows, lang, args.repeat)
+            print(
+                f"{label:<12} {lang}  legacy={legacy_ms:8.1f}ms ({legacy_size} B)  "
+                f"orjson={fast_ms:8.1f}ms ({fast_size} B)  x{legacy_ms / fast_ms:.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+# capacity.py - سعة الفترات (restaurant_id, date, time): القبول النهائي من قاعدة البيانات وسجل في الذاكرة
+#
+# جدول الحجوزات هو المرجع المشترك بين كل عمليات uvicorn: القبول يتم داخل معاملة الإدراج
+# بعد قفل صف المطعم (restaurant_lock_query) وجمع المقاعد المحجوزة في الفترة (held_people_query).
+# SQLite يتجاهل FOR UPDATE، فيأخذ القبول عليه قفل الكتابة أولاً (restaurant_write_lock).
+# السجل في الذاكرة خاص بكل عملية: فلتر سريع قبل Stripe والأقفال، ومصدر /availability.
+import os
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, date as date_type, time as time_type
+
+from sqlalchemy import and_, func, or_, select, update
+
+from models import Booking, BookingStatus, Restaurant
+
+# عمر قيمة الفترة في السجل قبل أن يعيد /availability قراءتها (تلتقط حجوزات وإلغاءات العمليات الأخرى)
+LEDGER_SLOT_TTL = float(os.getenv("LEDGER_SLOT_TTL", "30"))
+
+# الحالات التي تحجز مقاعد من سعة الفترة (الحجز المؤقت يحجز مكانه حتى يدفع أو تنتهي مهلته)
+HELD_STATUSES = (BookingStatus.pending, BookingStatus.confirmed)
+
+
+def slot_date(value) -> date_type:
+    # قواعد بيانات لم تُرحّل بعد قد ترجع عمود التاريخ كـ DateTime
+    return value.date() if isinstance(value, datetime) else value
+
+
+def restaurant_lock_query(restaurant_id: int):
+    # SELECT ... FOR UPDATE على صف المطعم: يسلسل قبول الحجوزات له بين كل العمليات حتى نهاية المعاملة
+    return select(Restaurant.capacity).where(Restaurant.id == restaurant_id).with_for_update()
+
+
+def needs_write_lock(db) -> bool:
+    return db.get_bind().dialect.name == "sqlite"
+
+
+def restaurant_write_lock(restaurant_id: int):
+    # كتابة لا تغير شيئاً (ولا updated_at) على صف المطعم: تأخذ قفل الكتابة على ملف SQLite حتى نهاية
+    # المعاملة، فيتسلسل القبول بين الاتصالات والعمليات كما مع FOR UPDATE في MySQL
+    return (
+        update(Restaurant)
+        .where(Restaurant.id == restaurant_id)
+        .values(capacity=Restaurant.capacity, updated_at=Restaurant.updated_at)
+    )
+
+
+def held_people_query(restaurant_id: int, day: date_type, at: time_type, exclude_booking_id: int = None):
+    # مجموع الأشخاص في الفترة من جدول الحجوزات (الفهرس ix_bookings_slot يغطيه)
+    query = select(func.coalesce(func.sum(Booking.people), 0)).where(
+        Booking.restaurant_id == restaurant_id,
+        Booking.date == day,
+        Booking.time == at,
+        Booking.status.in_(HELD_STATUSES)
+    )
+    if exclude_booking_id is not None:
+        query = query.where(Booking.id != exclude_booking_id)
+    return query
+
+
+class SlotLedger:
+    """
+    يحتفظ بعدد الأشخاص المحجوزين لكل فترة (التحديث تحت قفل).
+    السجل خاص بكل عملية (process) وقد يتأخر عن العمليات الأخرى، لذا لا يقبل حجزاً وحده:
+    يبنى من حجوزات اليوم وما بعده عند بدء التشغيل فقط، ثم يصحح فترة فترة بقيم قاعدة البيانات
+    (observe / refresh / refresh_stale) بدل إعادة بنائه كاملاً. الأيام الماضية تحذف (prune).
+    """
+
+    def __init__(self):
+        self._slots = defaultdict(int)
+        # وقت آخر قيمة من قاعدة البيانات لكل فترة (time.monotonic)، بما فيها الفترات الفارغة
+        self._observed = {}
+        self._lock = threading.Lock()
+        # الفترات التي تغيرت أثناء إعادة بناء جارية (لكل rebuild مجموعته)
+        self._recording = []
+
+    def _touch(self, key):
+        # يستدعى تحت القفل
+        for touched in self._recording:
+            touched.add(key)
+
+    @staticmethod
+    def _key(restaurant_id: int, day: date_type, at: time_type):
+        return (restaurant_id, day, at.replace(second=0, microsecond=0))
+
+    def booked(self, restaurant_id: int, day: date_type, at: time_type) -> int:
+        return self._slots.get(self._key(restaurant_id, day, at), 0)
+
+    def remaining(self, restaurant_id: int, day: date_type, at: time_type, capacity: int) -> int:
+        return max(capacity - self.booked(restaurant_id, day, at), 0)
+
+    def observe(self, restaurant_id: int, day: date_type, at: time_type, booked: int):
+        # قيمة قرأناها من قاعدة البيانات للتو تحل محل ما في الذاكرة
+        key = self._key(restaurant_id, day, at)
+        with self._lock:
+            if booked > 0:
+                self._slots[key] = int(booked)
+            else:
+                self._slots.pop(key, None)
+            self._observed[key] = time.monotonic()
+            self._touch(key)
+
+    def refresh_stale(self, db, slots, max_age: float = LEDGER_SLOT_TTL):
+        # إعادة قراءة الفترات التي مضى على قيمتها أكثر من max_age فقط
+        cutoff = time.monotonic() - max_age
+        stale = [
+            (restaurant_id, day, at) for restaurant_id, day, at in slots
+            if self._observed.get(self._key(restaurant_id, slot_date(day), at), float("-inf")) < cutoff
+        ]
+        if stale:
+            self.refresh(db, stale)
+
+    def prune(self, today: date_type = None) -> int:
+        # الفترات الماضية لا تحجز ولا تعرض، فلا نحتفظ بها
+        today = today or date_type.today()
+        with self._lock:
+            past = [key for key in self._observed.keys() | self._slots.keys() if key[1] < today]
+            for key in past:
+                self._slots.pop(key, None)
+                self._observed.pop(key, None)
+        return len(past)
+
+    def refresh(self, db, slots):
+        # إعادة قراءة فترات محددة باستعلام تجميعي واحد بعد تغيير فيها
+        keys = {self._key(restaurant_id, slot_date(day), at) for restaurant_id, day, at in slots}
+        if not keys:
+            return
+        rows = (
+            db.query(
+                Booking.restaurant_id,
+                Booking.date,
+                Booking.time,
+                func.sum(Booking.people)
+            )
+            .filter(
+                Booking.status.in_(HELD_STATUSES),
+                or_(*[
+                    and_(Booking.restaurant_id == restaurant_id, Booking.date == day, Booking.time == at)
+                    for restaurant_id, day, at in keys
+                ])
+            )
+            .group_by(Booking.restaurant_id, Booking.date, Booking.time)
+            .all()
+        )
+        booked = {self._key(restaurant_id, slot_date(day), at): int(people or 0) for restaurant_id, day, at, people in rows}
+        for key in keys:
+            self.observe(*key, booked.get(key, 0))
+
+    def rebuild(self, db):
+        # عند بدء التشغيل فقط. الفترات التي تتغير أثناء الاستعلام تحتفظ بقيمتها الحية بدل لقطة الاستعلام الأقدم منها
+        today = date_type.today()
+        touched = set()
+        with self._lock:
+            self._recording.append(touched)
+        try:
+            # استعلام تجميعي واحد بدل تحميل صفوف الحجوزات
+            rows = (
+                db.query(
+                    Booking.restaurant_id,
+                    Booking.date,
+                    Booking.time,
+                    func.sum(Booking.people)
+                )
+                .filter(Booking.status.in_(HELD_STATUSES), Booking.date >= today)
+                .group_by(Booking.restaurant_id, Booking.date, Booking.time)
+                .all()
+            )
+            observed_at = time.monotonic()
+
+            slots = defaultdict(int)
+            for restaurant_id, day, at, people in rows:
+                slots[self._key(restaurant_id, slot_date(day), at)] += int(people or 0)
+
+            with self._lock:
+                for key in touched:
+                    live = self._slots.get(key, 0)
+                    if live > 0:
+                        slots[key] = live
+                    else:
+                        slots.pop(key, None)
+                self._slots = slots
+                self._observed = {key: observed_at for key in slots}
+                for key in touched:
+                    self._observed[key] = observed_at
+            return len(slots)
+        finally:
+            with self._lock:
+                self._recording.remove(touched)
+
+
+ledger = SlotLedger()
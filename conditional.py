@@ -0,0 +1,66 @@
+# conditional.py - طلبات GET المشروطة (ETag / Last-Modified) لقراءات المطاعم
+#
+# قيم ETag مبنية على بيانات مشتركة بين كل العمليات (updated_at في قاعدة البيانات أو بصمة المحتوى)
+# وليس على حالة في ذاكرة عملية واحدة، فلا يرد worker بـ 304 على بيانات عدّلها worker آخر.
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+
+from fastapi.responses import Response
+
+# المتصفح يحتفظ بالنسخة لكن يتحقق منها في كل طلب
+REVALIDATE_CACHE = "no-cache"
+
+
+def etag(*parts) -> str:
+    return '"' + "-".join(str(part) for part in parts) + '"'
+
+
+def content_etag(body: bytes) -> str:
+    return etag(hashlib.blake2b(body, digest_size=10).hexdigest())
+
+
+def http_date(value: datetime) -> str:
+    # التواريخ في قاعدة البيانات بدون منطقة زمنية: نعاملها كـ UTC
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return format_datetime(value.astimezone(timezone.utc), usegmt=True)
+
+
+def if_none_match(request, tag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    # مقارنة ضعيفة كما يطلب المعيار لـ If-None-Match (نتجاهل البادئة W/)
+    candidates = (candidate.strip() for candidate in header.split(","))
+    return tag in (c[2:] if c.startswith("W/") else c for c in candidates)
+
+
+def not_modified_since(request, last_modified: datetime) -> bool:
+    # يستخدم فقط عند غياب If-None-Match (ETag أدق من التاريخ)
+    header = request.headers.get("if-modified-since")
+    if not header or request.headers.get("if-none-match"):
+        return False
+    try:
+        since = parsedate_to_datetime(header)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    if last_modified.tzinfo is None:
+        last_modified = last_modified.replace(tzinfo=timezone.utc)
+    # التاريخ في الترويسة بدقة الثانية
+    return last_modified.replace(microsecond=0) <= since
+
+
+def validators(tag: str, last_modified: datetime = None) -> dict:
+    headers = {"ETag": tag, "Cache-Control": REVALIDATE_CACHE}
+    if last_modified is not None:
+        headers["Last-Modified"] = http_date(last_modified)
+    return headers
+
+
+def not_modified(tag: str, last_modified: datetime = None) -> Response:
+    return Response(status_code=304, headers=validators(tag, last_modified))
@@ -1,34 +1,17 @@
-# cron.py - Scheduler لتحديث الحجوزات المنتهية
-from apscheduler.schedulers.background import BackgroundScheduler
-from datetime import datetime, timedelta, timezone
-from db import get_db
-from models import Booking, BookingStatus
-import time
+# cron.py - Scheduler مستقل لتحديث الحجوزات المنتهية
+#
+# التطبيق يلغي كل حجز عند انتهاء مهلته داخلياً افتراضياً (EXPIRY_IN_APP=1).
+# استخدم هذا السكربت فقط عند تعطيله في التطبيق (EXPIRY_IN_APP=0). الإلغاء يحدث هنا في عملية أخرى،
+# فيراه سجل السعة في التطبيق عند إعادة قراءة الفترة (LEDGER_SLOT_TTL، أو فوراً عند رفض حجز).
+from apscheduler.schedulers.blocking import BlockingScheduler
 
-def cleanup_expired_bookings():
-    """
-    تغيّر حالة الحجوزات التي لم يتم دفعها بعد انتهاء المدة إلى Cancelled.
-    """
-    db = next(get_db())
-    expiration = datetime.now() - timedelta(minutes=2)  # مدة انتهاء الحجز
-    
-    expired_bookings = db.query(Booking).filter(
-        Booking.status == BookingStatus.pending,
-        Booking.created_at < expiration
-    ).all()
-
-    for b in expired_bookings:
-        b.status = BookingStatus.cancelled
-
-    db.commit()
-    print(f"[{datetime.now(timezone.utc)}] Updated {len(expired_bookings)} bookings to Cancelled")
+from expiry import sweep_expired_bookings, SWEEP_INTERVAL_SECONDS
 
 # إعداد الـ scheduler
-scheduler = BackgroundScheduler()
-scheduler.add_job(cleanup_expired_bookings, 'interval', minutes=1)  # كل  دقائق
-scheduler.start()
-print("Scheduler started...")
+scheduler = BlockingScheduler()
+scheduler.add_job(sweep_expired_bookings, 'interval', seconds=SWEEP_INTERVAL_SECONDS, max_instances=1)
 
-# إبقاء السكربت يعمل في الخلفية
-while True:
-    time.sleep(60)
+if __name__ == "__main__":
+    print("Scheduler started...")
+    sweep_expired_bookings()
+    scheduler.start()
@@ -1,7 +1,14 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from dotenv import load_dotenv
 import os
+import threading
+import time
+
+from metrics import instrument_engine
 
 # تحميل متغيرات البيئة
 load_dotenv()
@@ -12,14 +19,151 @@ DB_HOST = os.getenv("DB_HOST", "localhost")
 DB_PORT = os.getenv("DB_PORT", "3306")
 DB_NAME = os.getenv("DB_NAME")
 
-DATABASE_URL = f"mysql+pymysql://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+# يمكن تجاوز الروابط بالكامل (مثلاً SQLite محلي للتجارب واختبارات الأداء)
+DATABASE_URL = os.getenv(
+    "DATABASE_URL",
+    f"mysql+pymysql://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+)
+ASYNC_DATABASE_URL = os.getenv(
+    "ASYNC_DATABASE_URL",
+    f"mysql+aiomysql://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+)
+
+
+# إعدادات مجموعة الاتصالات (تُحسب مع عدد workers في uvicorn: الإجمالي = workers × (size + overflow))
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+# أقل من wait_timeout في MySQL حتى لا نستخدم اتصالاً أغلقه الخادم ("MySQL server has gone away")
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1") == "1"
+
+
+class PoolMetrics:
+    """عدادات مجموعة اتصالات واحدة: الانتظار، التجاوز، والاتصالات الملغاة."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.pool = None
+        self._lock = threading.Lock()
+        self.connects = 0
+        self.checkouts = 0
+        self.invalidations = 0
+        self.soft_invalidations = 0
+        self.timeouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    def record_wait(self, seconds: float, timed_out: bool = False):
+        with self._lock:
+            self.wait_seconds_total += seconds
+            self.wait_seconds_max = max(self.wait_seconds_max, seconds)
+            if timed_out:
+                self.timeouts += 1
+
+    def listen(self, sync_engine):
+        def on_connect(dbapi_conn, record):
+            self.connects += 1
+
+        def on_checkout(dbapi_conn, record, proxy):
+            self.checkouts += 1
+
+        def on_invalidate(dbapi_conn, record, exc):
+            self.invalidations += 1
+
+        def on_soft_invalidate(dbapi_conn, record, exc):
+            self.soft_invalidations += 1
+
+        event.listen(sync_engine, "connect", on_connect)
+        event.listen(sync_engine, "checkout", on_checkout)
+        event.listen(sync_engine, "invalidate", on_invalidate)
+        event.listen(sync_engine, "soft_invalidate", on_soft_invalidate)
+
+    def snapshot(self) -> dict:
+        pool = self.pool
+        queue_pool = isinstance(pool, QueuePool)
+        return {
+            "size": pool.size() if queue_pool else None,
+            "checked_out": pool.checkedout() if queue_pool else None,
+            "checked_in": pool.checkedin() if queue_pool else None,
+            "overflow": pool.overflow() if queue_pool else None,
+            "connects": self.connects,
+            "checkouts": self.checkouts,
+            "invalidations": self.invalidations,
+            "soft_invalidations": self.soft_invalidations,
+            "timeouts": self.timeouts,
+            "wait_seconds_total": round(self.wait_seconds_total, 6),
+            "wait_seconds_max": round(self.wait_seconds_max, 6),
+            "wait_seconds_avg": round(self.wait_seconds_total / self.checkouts, 6) if self.checkouts else 0.0,
+        }
+
+
+def instrumented_pool(pool_cls, metrics: PoolMetrics):
+    # نقيس زمن انتظار الحصول على اتصال من المجموعة (يشمل الانتظار عند امتلائها)
+    def _do_get(self):
+        metrics.pool = self
+        start = time.perf_counter()
+        try:
+            connection = pool_cls._do_get(self)
+        except PoolTimeoutError:
+            metrics.record_wait(time.perf_counter() - start, timed_out=True)
+            raise
+        metrics.record_wait(time.perf_counter() - start)
+        return connection
+
+    return type(f"Instrumented{pool_cls.__name__}", (pool_cls,), {"_do_get": _do_get})
+
+
+def connect_args_for(url: str) -> dict:
+    return {"charset": "utf8mb4"} if url.startswith("mysql") else {}
+
+
+def pool_args_for(url: str, pool_cls, metrics: PoolMetrics) -> dict:
+    if url.startswith("sqlite"):
+        # SQLite يستخدم مجموعته الافتراضية
+        return {}
+    return {
+        "poolclass": instrumented_pool(pool_cls, metrics),
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+
+
+pool_metrics = {
+    "sync": PoolMetrics("sync"),
+    "async": PoolMetrics("async"),
+}
 
 engine = create_engine(
     DATABASE_URL,
-    connect_args={"charset": "utf8mb4"},
+    connect_args=connect_args_for(DATABASE_URL),
+    **pool_args_for(DATABASE_URL, QueuePool, pool_metrics["sync"]),
     #echo=True
 )
 
+# محرك غير متزامن للـ endpoints من نوع async def حتى لا توقف حلقة الأحداث
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    connect_args=connect_args_for(ASYNC_DATABASE_URL),
+    **pool_args_for(ASYNC_DATABASE_URL, AsyncAdaptedQueuePool, pool_metrics["async"]),
+)
+
+pool_metrics["sync"].pool = engine.pool
+pool_metrics["sync"].listen(engine)
+pool_metrics["async"].pool = async_engine.sync_engine.pool
+pool_metrics["async"].listen(async_engine.sync_engine)
+
+# عدد وزمن الاستعلامات لكل طلب ولـ /metrics
+instrument_engine(engine, "sync")
+instrument_engine(async_engine.sync_engine, "async")
+
+
+def pool_stats() -> dict:
+    return {name: metrics.snapshot() for name, metrics in pool_metrics.items()}
+
 Base = declarative_base()
 
 SessionLocal = sessionmaker(
@@ -28,6 +172,13 @@ SessionLocal = sessionmaker(
     bind=engine
 )
 
+AsyncSessionLocal = async_sessionmaker(
+    async_engine,
+    autoflush=False,
+    # الكائنات تبقى مقروءة بعد commit بدون استعلام جديد (lazy load غير مسموح في async)
+    expire_on_commit=False
+)
+
 # دالة Dependency لاستخدامها في FastAPI
 def get_db():
     db = SessionLocal()
@@ -35,3 +186,9 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+# نسخة غير متزامنة من get_db
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -1,8 +1,12 @@
 import os
+import threading
 from dotenv import load_dotenv
-import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
+from sqlalchemy import event
+
+from db import SessionLocal
+from models import EmailOutbox
 
 load_dotenv()  # تحميل إعدادات البريد من .env
 
@@ -14,26 +18,50 @@ SMTP_PASSWORD = os.getenv("SMTP_PASSWORD")
 FROM_EMAIL = os.getenv("FROM_EMAIL")
 
 
-# دالة الإرسال العامة
-def send_email(to_email, subject, body):
+# إشارة لإيقاظ عامل الإرسال فور إضافة رسالة جديدة
+outbox_ready = threading.Event()
+
+
+# بناء الرسالة (يستخدمها عامل الإرسال في mailer.py)
+def build_message(to_email, subject, body):
     msg = MIMEMultipart()
     msg['From'] = FROM_EMAIL
     msg['To'] = to_email
     msg['Subject'] = subject
 
     msg.attach(MIMEText(body, 'plain'))
+    return msg
+
+
+def _wake_worker(session):
+    outbox_ready.set()
+
+
+# دالة الإرسال العامة: تحفظ الرسالة في صندوق الصادر فقط، والإرسال الفعلي في الخلفية.
+# مع db: تضاف الرسالة إلى معاملة المستدعي قبل commit، فتحفظ مع تغيير الحالة الذي سببها أو لا تحفظ
+# أبداً (لا تضيع إذا توقفت العملية بين commit الحجز و commit الرسالة)، ويوقظ العامل بعد commit.
+def send_email(to_email, subject, body, db=None):
+    if db is not None:
+        db.add(EmailOutbox(to_email=to_email, subject=subject, body=body))
+        # AsyncSession: الأحداث على الجلسة المتزامنة التي يغلفها
+        event.listen(getattr(db, "sync_session", db), "after_commit", _wake_worker, once=True)
+        return
 
+    db = SessionLocal()
     try:
-        with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as server:
-            # server.login(SMTP_USERNAME, SMTP_PASSWORD)X
-            server.send_message(msg)
-        print(f"Email sent to {to_email} successfully!")
+        db.add(EmailOutbox(to_email=to_email, subject=subject, body=body))
+        db.commit()
+        outbox_ready.set()
+        print(f"Email to {to_email} queued")
     except Exception as e:
-        print(f"Failed to send email to {to_email}: {e}")
+        db.rollback()
+        print(f"Failed to queue email to {to_email}: {e}")
+    finally:
+        db.close()
 
 
 # ✉️ إيميل ترحيبي
-def send_welcome_email(user_name, user_email):
+def send_welcome_email(user_name, user_email, db=None):
     subject = "مرحباً بك في موقعنا!"
     body = f"""مرحباً {user_name}،
 
@@ -43,11 +71,11 @@ def send_welcome_email(user_name, user_email):
 
 مع تحيات فريقنا
 """
-    send_email(user_email, subject, body)
+    send_email(user_email, subject, body, db)
 
 
 # 📅 إيميل تأكيد الحجز
-def send_booking_confirmation(user_name, user_email, booking_id, date, time, service_name):
+def send_booking_confirmation(user_name, user_email, booking_id, date, time, service_name, db=None):
     subject = "تأكيد حجزك"
     body = f"""مرحباً {user_name}،
 
@@ -62,12 +90,12 @@ def send_booking_confirmation(user_name, user_email, booking_id, date, time, ser
 
 مع تحيات فريقنا
 """
-    send_email(user_email, subject, body)
+    send_email(user_email, subject, body, db)
 
 
 # ❌ إيميل إلغاء الحجز الجديد
 # إرسال إيميل إلغاء الحجز
-def send_booking_cancellation(user_name, user_email, booking_id, date, time, service_name):
+def send_booking_cancellation(user_name, user_email, booking_id, date, time, service_name, db=None):
     subject = "تم إلغاء حجزك"
     body = f"""مرحباً {user_name}،
 
@@ -82,4 +110,4 @@ def send_booking_cancellation(user_name, user_email, booking_id, date, time, ser
 
 مع تحيات فريقنا
 """
-    send_email(user_email, subject, body)
+    send_email(user_email, subject, body, db)
@@ -0,0 +1,197 @@
+# expiry.py - محرك انتهاء الحجوزات المؤقتة غير المدفوعة (يعمل داخل التطبيق أو عبر cron.py)
+#
+# داخل التطبيق: مؤقت لكل حجز (HoldTimer) يلغيه عند انتهاء مهلته بالضبط،
+# مع دورة تنظيف احتياطية متباعدة. عبر cron.py: دورة التنظيف فقط.
+import heapq
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from db import SessionLocal
+from models import Booking, BookingStatus
+from capacity import ledger, slot_date
+from payments import checkout_session_id, expire_checkout_sessions
+
+# مدة الحجز المؤقت قبل إلغائه إذا لم يدفع
+HOLD_MINUTES = int(os.getenv("HOLD_MINUTES", "2"))
+SWEEP_BATCH_SIZE = int(os.getenv("SWEEP_BATCH_SIZE", "500"))
+SWEEP_INTERVAL_SECONDS = int(os.getenv("SWEEP_INTERVAL_SECONDS", "60"))
+# دورة التنظيف داخل التطبيق عندما يعمل المؤقت (لحجوزات عمليات أخرى أو مؤقتات فاتت)
+SWEEP_BACKSTOP_SECONDS = int(os.getenv("SWEEP_BACKSTOP_SECONDS", "600"))
+
+# نتيجة آخر دورة (للمراقبة)
+last_sweep = {"expired": 0, "batches": 0, "seconds": 0.0, "finished_at": None}
+
+
+def _cancel_pending(db, *criteria, limit: int = None):
+    """
+    يقفل الحجوزات pending المطابقة (SKIP LOCKED) ويلغيها بـ UPDATE واحد ثم يعيد قراءة فتراتها للسجل.
+    SKIP LOCKED حتى لا يتعارض مع تأكيد دفع جارٍ على نفس الحجز أو مع عامل آخر.
+    لا نطرح المقاعد من السجل مباشرة: الحجز ربما حُجز في عملية أخرى، فيصبح سجل هذه العملية أقل من الواقع.
+    بعد الإلغاء تنهى جلسات Stripe للحجوزات حتى لا يدفع أحد لحجز أعيدت مقاعده للسعة.
+    """
+    query = (
+        db.query(Booking.id, Booking.restaurant_id, Booking.date, Booking.time, Booking.people, Booking.client_secret)
+        .filter(Booking.status == BookingStatus.pending, *criteria)
+    )
+    if limit:
+        query = query.order_by(Booking.created_at).limit(limit)
+    rows = query.with_for_update(skip_locked=True).all()
+    if not rows:
+        db.commit()
+        return rows
+
+    db.query(Booking).filter(Booking.id.in_([r.id for r in rows])).update(
+        {Booking.status: BookingStatus.cancelled},
+        synchronize_session=False
+    )
+    db.commit()
+
+    ledger.refresh(db, {(r.restaurant_id, slot_date(r.date), r.time) for r in rows})
+    db.commit()
+
+    # بعد commit وخارج أي معاملة. إذا اكتمل الدفع قبل الإنهاء يعيد confirm_booking قبول الحجز أو يسترد المبلغ
+    expire_checkout_sessions([s for s in (checkout_session_id(r.client_secret) for r in rows) if s])
+    return rows
+
+
+def sweep_expired_bookings(batch_size: int = SWEEP_BATCH_SIZE) -> dict:
+    """
+    تغيّر حالة الحجوزات التي لم يتم دفعها بعد انتهاء المدة إلى Cancelled،
+    على دفعات: SELECT بالفهرس (status, created_at) ثم UPDATE واحد بالمفاتيح لكل دفعة.
+    """
+    started = time.perf_counter()
+    # created_at يُملأ بوقت خادم قاعدة البيانات (func.now) بالتوقيت المحلي
+    cutoff = datetime.now() - timedelta(minutes=HOLD_MINUTES)
+    expired = 0
+    batches = 0
+
+    db = SessionLocal()
+    try:
+        while True:
+            rows = _cancel_pending(db, Booking.created_at < cutoff, limit=batch_size)
+            if not rows:
+                break
+            expired += len(rows)
+            batches += 1
+            if len(rows) < batch_size:
+                break
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+    seconds = time.perf_counter() - started
+    last_sweep.update(expired=expired, batches=batches, seconds=seconds, finished_at=datetime.now(timezone.utc))
+    print(f"[{last_sweep['finished_at']}] Expired {expired} bookings in {batches} batches ({seconds * 1000:.1f}ms)")
+    return {"expired": expired, "batches": batches, "seconds": round(seconds, 6)}
+
+
+def expire_bookings(booking_ids) -> int:
+    # إلغاء حجوزات محددة انتهت مهلتها (الحجوزات المؤكدة أو الملغاة يتم تجاهلها)
+    db = SessionLocal()
+    try:
+        return len(_cancel_pending(db, Booking.id.in_(list(booking_ids))))
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+class HoldTimer:
+    """
+    طابور أولويات (heap) لمواعيد انتهاء الحجوزات المؤقتة مع thread واحد ينام حتى أقرب موعد.
+    الحذف كسول: الإدخال يتجاهل إذا تغير موعده أو أُزيل من _deadlines.
+    """
+
+    def __init__(self, hold: timedelta = timedelta(minutes=HOLD_MINUTES)):
+        self.hold = hold
+        self._heap = []           # (deadline, booking_id)
+        self._deadlines = {}      # booking_id -> deadline
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopped = False
+
+    def __len__(self):
+        return len(self._deadlines)
+
+    def schedule(self, booking_id: int, created_at: datetime = None):
+        # بدون مؤقت يعمل (EXPIRY_IN_APP=0) تتكفل دورة cron.py بالانتهاء
+        if self._thread is None:
+            return
+        deadline = (created_at or datetime.now()) + self.hold
+        with self._cond:
+            self._deadlines[booking_id] = deadline
+            heapq.heappush(self._heap, (deadline, booking_id))
+            if self._heap[0][1] == booking_id:
+                self._cond.notify()
+
+    def discard(self, booking_id: int):
+        with self._cond:
+            self._deadlines.pop(booking_id, None)
+
+    def rebuild(self, db):
+        # بعد إعادة التشغيل: كل الحجوزات pending بموعد انتهائها من created_at (عبر الفهرس)
+        rows = (
+            db.query(Booking.id, Booking.created_at)
+            .filter(Booking.status == BookingStatus.pending)
+            .all()
+        )
+        now = datetime.now()
+        with self._cond:
+            self._deadlines = {r.id: (r.created_at or now) + self.hold for r in rows}
+            self._heap = [(deadline, booking_id) for booking_id, deadline in self._deadlines.items()]
+            heapq.heapify(self._heap)
+            self._cond.notify()
+        return len(rows)
+
+    def _pop_due(self, now: datetime):
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            deadline, booking_id = heapq.heappop(self._heap)
+            if self._deadlines.get(booking_id) == deadline:
+                del self._deadlines[booking_id]
+                due.append(booking_id)
+        return due
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._stopped:
+                    now = datetime.now()
+                    if self._heap and self._heap[0][0] <= now:
+                        break
+                    timeout = (self._heap[0][0] - now).total_seconds() if self._heap else None
+                    self._cond.wait(timeout)
+                if self._stopped:
+                    return
+                due = self._pop_due(now)
+
+            if not due:
+                continue
+            try:
+                expired = expire_bookings(due)
+                print(f"[{datetime.now(timezone.utc)}] Hold timer expired {expired}/{len(due)} bookings")
+            except Exception as e:
+                # الحجوزات التي فاتت ستلتقطها دورة التنظيف الاحتياطية
+                print(f"Hold timer error: {e}")
+
+    def start(self):
+        if self._thread is None:
+            self._stopped = False
+            self._thread = threading.Thread(target=self._run, name="hold-timer", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            with self._cond:
+                self._stopped = True
+                self._cond.notify()
+            self._thread.join(timeout=5)
+            self._thread = None
+
+
+hold_timer = HoldTimer()
@@ -0,0 +1,70 @@
+# i18n.py - حزم الترجمة لكل لغة ولكل صفحة من مصدر واحد (i18n/catalog.json)
+#
+# لكل قالب صفحة نجمع المعرّفات (id) المستخدمة فيه وفي القوالب التي يرثها أو يضمّنها،
+# ونرسل للمتصفح ترجمات هذه المعرّفات فقط وباللغة النشطة في الجلسة فقط.
+import json
+import os
+import re
+
+from jinja2 import pass_context
+from jinja2.utils import htmlsafe_json_dumps
+
+CATALOG_PATH = os.path.join("i18n", "catalog.json")
+TEMPLATES_DIR = "templates"
+SUPPORTED_LANGS = ("ar", "en")
+DEFAULT_LANG = "ar"
+
+_ID = re.compile(r"""\bid\s*=\s*["']([^"'{}]+)["']""")
+_REFERENCE = re.compile(r"""{%-?\s*(?:extends|include)\s+["']([^"']+)["']""")
+
+
+def load_catalog(path: str = CATALOG_PATH) -> dict:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def template_ids(name: str, templates_dir: str = TEMPLATES_DIR, seen: set = None) -> set:
+    seen = set() if seen is None else seen
+    if name in seen:
+        return set()
+    seen.add(name)
+
+    with open(os.path.join(templates_dir, name), encoding="utf-8") as f:
+        source = f.read()
+    ids = set(_ID.findall(source))
+    for parent in _REFERENCE.findall(source):
+        ids |= template_ids(parent, templates_dir, seen)
+    return ids
+
+
+def build_bundles(catalog: dict, templates_dir: str = TEMPLATES_DIR) -> dict:
+    # (lang, page) -> JSON جاهز للحقن داخل <script>
+    bundles = {}
+    for page in sorted(os.listdir(templates_dir)):
+        if not page.endswith(".html"):
+            continue
+        ids = template_ids(page, templates_dir)
+        for lang in SUPPORTED_LANGS:
+            strings = catalog.get(lang, {})
+            bundles[(lang, page)] = htmlsafe_json_dumps({key: text for key, text in strings.items() if key in ids})
+    return bundles
+
+
+catalog = load_catalog()
+bundles = build_bundles(catalog)
+
+
+def session_lang(request) -> str:
+    lang = request.session.get("lang") if request is not None else None
+    return lang if lang in SUPPORTED_LANGS else DEFAULT_LANG
+
+
+@pass_context
+def page_lang(context) -> str:
+    return session_lang(context.get("request"))
+
+
+@pass_context
+def i18n_bundle(context):
+    # context.name هو قالب الصفحة نفسه حتى داخل base.html (الوراثة تشارك نفس الـ context)
+    return bundles.get((session_lang(context.get("request")), context.name), "{}")
@@ -0,0 +1,189 @@
+# mailer.py - عامل الخلفية لإرسال رسائل صندوق الصادر عبر اتصال SMTP واحد معاد استخدامه
+#
+# يعمل داخل التطبيق (EMAIL_WORKER=1، الافتراضي) أو مستقلاً:
+#   python mailer.py
+# للتجربة محلياً بدون خادم بريد حقيقي:
+#   python -m scripts.smtp_sink   ثم   SMTP_SERVER=localhost SMTP_PORT=1025
+import os
+import smtplib
+import threading
+import time
+from datetime import datetime, timedelta
+
+from db import SessionLocal
+from models import EmailOutbox
+from emails import SMTP_SERVER, SMTP_PORT, build_message, outbox_ready
+from metrics import external_call
+
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "20"))
+OUTBOX_POLL_SECONDS = float(os.getenv("OUTBOX_POLL_SECONDS", "5"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "6"))
+OUTBOX_BACKOFF_SECONDS = int(os.getenv("OUTBOX_BACKOFF_SECONDS", "30"))
+OUTBOX_BACKOFF_MAX_SECONDS = int(os.getenv("OUTBOX_BACKOFF_MAX_SECONDS", "3600"))
+SMTP_TIMEOUT = float(os.getenv("SMTP_TIMEOUT", "10"))
+# مدة حجز الدفعة لعامل واحد: يجب أن تتجاوز زمن إرسال دفعة كاملة
+OUTBOX_LEASE_SECONDS = int(os.getenv("OUTBOX_LEASE_SECONDS", "300"))
+# إغلاق الاتصال إذا بقي خاملاً أكثر من هذه المدة
+SMTP_IDLE_SECONDS = float(os.getenv("SMTP_IDLE_SECONDS", "60"))
+
+
+class SMTPConnection:
+    """اتصال SMTP واحد يعاد استخدامه بين الرسائل ويعاد فتحه عند انقطاعه."""
+
+    def __init__(self, host=SMTP_SERVER, port=SMTP_PORT, timeout=SMTP_TIMEOUT):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self._server = None
+        self._last_used = 0.0
+
+    def _connect(self):
+        server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        # server.login(SMTP_USERNAME, SMTP_PASSWORD)
+        return server
+
+    def get(self):
+        if self._server is not None and time.monotonic() - self._last_used > SMTP_IDLE_SECONDS:
+            # الاتصال الخامل قد يكون أغلق من طرف الخادم
+            try:
+                self._server.noop()
+            except (smtplib.SMTPException, OSError):
+                self.reset()
+        if self._server is None:
+            self._server = self._connect()
+        return self._server
+
+    def send(self, msg):
+        with external_call("smtp"):
+            try:
+                self.get().send_message(msg)
+            except smtplib.SMTPServerDisconnected:
+                # محاولة واحدة على اتصال جديد
+                self.reset()
+                self.get().send_message(msg)
+        self._last_used = time.monotonic()
+
+    def reset(self):
+        if self._server is not None:
+            try:
+                self._server.close()
+            except Exception:
+                pass
+        self._server = None
+
+    def close(self):
+        if self._server is not None:
+            try:
+                self._server.quit()
+            except Exception:
+                pass
+        self._server = None
+
+
+def backoff_delay(attempts: int) -> timedelta:
+    # تأخير أسي: 30ث، 60ث، 120ث ... بحد أقصى ساعة
+    return timedelta(seconds=min(OUTBOX_BACKOFF_SECONDS * 2 ** (attempts - 1), OUTBOX_BACKOFF_MAX_SECONDS))
+
+
+def send_batch(connection: SMTPConnection, batch_size: int = OUTBOX_BATCH_SIZE) -> int:
+    """
+    يرسل دفعة من الرسائل المستحقة ويرجع عدد الرسائل التي تمت معالجتها.
+    الحجز يتم في معاملة قصيرة: SKIP LOCKED ثم تأجيل next_attempt_at بمدة OUTBOX_LEASE_SECONDS،
+    فلا يأخذ عامل آخر نفس الرسائل ولا تبقى الأقفال (ولا اتصال قاعدة البيانات) محجوزة أثناء SMTP.
+    إذا توقف العامل قبل تسجيل النتيجة تعود الرسالة مستحقة بعد انتهاء المدة.
+    """
+    db = SessionLocal()
+    try:
+        now = datetime.utcnow()
+        messages = (
+            db.query(EmailOutbox)
+            .filter(EmailOutbox.status == "pending", EmailOutbox.next_attempt_at <= now)
+            .order_by(EmailOutbox.id)
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
+            .all()
+        )
+        claimed = []
+        for m in messages:
+            m.attempts += 1
+            m.next_attempt_at = now + timedelta(seconds=OUTBOX_LEASE_SECONDS)
+            claimed.append((m.id, m.to_email, m.subject, m.body, m.attempts))
+        db.commit()
+
+        for message_id, to_email, subject, body, attempts in claimed:
+            try:
+                connection.send(build_message(to_email, subject, body))
+                values = {"status": "sent", "sent_at": datetime.utcnow(), "last_error": None}
+            except Exception as e:
+                connection.reset()
+                values = {"last_error": str(e)}
+                if attempts >= OUTBOX_MAX_ATTEMPTS:
+                    values["status"] = "failed"
+                    print(f"Failed to send email to {to_email}: {e}")
+                else:
+                    values["next_attempt_at"] = datetime.utcnow() + backoff_delay(attempts)
+
+            # تسجيل كل نتيجة فوراً حتى لا تعاد رسالة أرسلت إذا توقف العامل وسط الدفعة
+            db.query(EmailOutbox).filter(EmailOutbox.id == message_id).update(values, synchronize_session=False)
+            db.commit()
+        return len(claimed)
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+class OutboxWorker(threading.Thread):
+    def __init__(self):
+        super().__init__(name="outbox-worker", daemon=True)
+        self._stop_event = threading.Event()
+        self.connection = SMTPConnection()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            outbox_ready.clear()
+            try:
+                sent = send_batch(self.connection)
+            except Exception as e:
+                print(f"Outbox worker error: {e}")
+                sent = 0
+
+            # دفعة كاملة تعني غالباً وجود المزيد، لذا نكمل مباشرة
+            if sent < OUTBOX_BATCH_SIZE:
+                outbox_ready.wait(OUTBOX_POLL_SECONDS)
+
+        self.connection.close()
+
+    def stop(self):
+        self._stop_event.set()
+        outbox_ready.set()
+
+
+_worker = None
+
+
+def start_worker():
+    global _worker
+    if _worker is None:
+        _worker = OutboxWorker()
+        _worker.start()
+    return _worker
+
+
+def stop_worker():
+    global _worker
+    if _worker is not None:
+        _worker.stop()
+        _worker.join(timeout=SMTP_TIMEOUT)
+        _worker = None
+
+
+if __name__ == "__main__":
+    worker = start_worker()
+    print("Outbox worker started...")
+    try:
+        while worker.is_alive():
+            time.sleep(1)
+    except KeyboardInterrupt:
+        stop_worker()
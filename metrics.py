@@ -0,0 +1,162 @@
+# metrics.py - مقاييس الأداء بصيغة Prometheus: زمن كل مسار، استعلامات قاعدة البيانات، والاستدعاءات الخارجية
+#
+# التوزيعات (histograms) تجمع في الذاكرة لكل عملية وتعرض عبر /metrics.
+# إحصائيات الطلب الحالي (عدد الاستعلامات وزمنها وزمن Stripe/SMTP) تحفظ في contextvar
+# يضبطه الـ middleware، فتصل إليها أحداث SQLAlchemy والـ threadpool بدون تمرير صريح.
+import contextvars
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+# طلب أبطأ من هذا يطبع في السجل مع تفاصيله (0 للتعطيل)
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "1000"))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _labels(names, values, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, labels: tuple, buckets: tuple):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = buckets
+        # قيم التسميات -> [عدد كل bucket ..., المجموع, العدد]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * len(self.buckets) + [0.0, 0]
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((values, list(series)) for values, series in self._series.items())
+        for values, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                labels = _labels(self.labels, values, 'le="%s"' % bound)
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _labels(self.labels, values, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{labels} {series[-1]}")
+            lines.append(f"{self.name}_sum{_labels(self.labels, values)} {series[-2]:.6f}")
+            lines.append(f"{self.name}_count{_labels(self.labels, values)} {series[-1]}")
+        return lines
+
+
+def gauge_lines(name: str, help_text: str, samples) -> list:
+    # samples: [(dict تسميات, قيمة)]
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"]
+    for labels, value in samples:
+        if value is not None:
+            lines.append(f"{name}{_labels(labels.keys(), labels.values())} {value}")
+    return lines
+
+
+http_request_seconds = Histogram(
+    "http_request_duration_seconds", "Request latency per route.",
+    ("method", "route", "status"), LATENCY_BUCKETS
+)
+http_request_queries = Histogram(
+    "http_request_db_queries", "Database statements executed per request.",
+    ("route",), QUERY_COUNT_BUCKETS
+)
+db_query_seconds = Histogram(
+    "db_query_duration_seconds", "Database statement latency.",
+    ("engine",), QUERY_BUCKETS
+)
+external_call_seconds = Histogram(
+    "external_call_duration_seconds", "Latency of calls to external services (Stripe, SMTP).",
+    ("service", "outcome"), LATENCY_BUCKETS
+)
+HISTOGRAMS = (http_request_seconds, http_request_queries, db_query_seconds, external_call_seconds)
+
+
+class RequestStats:
+    __slots__ = ("db_count", "db_seconds", "external")
+
+    def __init__(self):
+        self.db_count = 0
+        self.db_seconds = 0.0
+        self.external = {}
+
+    def server_timing(self, seconds: float) -> str:
+        # ترويسة Server-Timing تظهر في أدوات المطور في المتصفح
+        parts = [f"app;dur={seconds * 1000:.1f}", f'db;dur={self.db_seconds * 1000:.1f};desc="{self.db_count} queries"']
+        parts += [f"{service};dur={spent * 1000:.1f}" for service, spent in self.external.items()]
+        return ", ".join(parts)
+
+
+current_request = contextvars.ContextVar("request_stats", default=None)
+
+
+def instrument_engine(sync_engine, name: str):
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        context._metrics_start = time.perf_counter()
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - context._metrics_start
+        db_query_seconds.observe(elapsed, name)
+        stats = current_request.get()
+        if stats is not None:
+            stats.db_count += 1
+            stats.db_seconds += elapsed
+
+
+@contextmanager
+def external_call(service: str):
+    outcome = "error"
+    start = time.perf_counter()
+    try:
+        yield
+        outcome = "ok"
+    finally:
+        elapsed = time.perf_counter() - start
+        external_call_seconds.observe(elapsed, service, outcome)
+        stats = current_request.get()
+        if stats is not None:
+            stats.external[service] = stats.external.get(service, 0.0) + elapsed
+
+
+def record_request(method: str, route: str, status: int, seconds: float, stats: RequestStats):
+    http_request_seconds.observe(seconds, method, route, str(status))
+    http_request_queries.observe(stats.db_count, route)
+    if SLOW_REQUEST_MS and seconds * 1000 >= SLOW_REQUEST_MS:
+        external = " ".join(f"{service}={spent * 1000:.0f}ms" for service, spent in stats.external.items())
+        print(f"🐢 Slow request {method} {route} {status}: {seconds * 1000:.0f}ms "
+              f"db={stats.db_count}q/{stats.db_seconds * 1000:.0f}ms {external}".rstrip())
+
+
+def render(extra_lines=()) -> str:
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines += histogram.render()
+    lines += extra_lines
+    return "\n".join(lines) + "\n"
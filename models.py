@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Time, Enum, ForeignKey, Text
+from sqlalchemy import Column, Integer, String, Date, DateTime, Time, Enum, ForeignKey, Text, Index
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from enum import Enum as PyEnum
@@ -17,7 +17,7 @@ class User(Base):
     fullname = Column(String(100), nullable=False)
     email = Column(String(100), unique=True, nullable=False)
     password = Column(String(100), nullable=False)
-    token = Column(String(100), nullable=True)  # لتخزين توكن الجلسة أو أي مفتاح
+    token = Column(String(100), nullable=True, index=True)  # لتخزين توكن الجلسة أو أي مفتاح
     last_login = Column(DateTime, nullable=True)
     created_at = Column(DateTime, default=func.now(), nullable=False)
     updated_at = Column(DateTime, default=func.now(), onupdate=func.now(), nullable=False)
@@ -62,20 +62,36 @@ class Booking(Base):
     id = Column(Integer, primary_key=True)
     restaurant_id = Column(Integer, ForeignKey("restaurants.id"), nullable=False)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
-    date = Column(DateTime, nullable=False)  # يمكنك استخدام Date فقط إذا أحببت
+    date = Column(Date, nullable=False)  # تاريخ فقط حتى تستفيد الفلاتر من الفهارس
     time = Column(Time, nullable=False)
     people = Column(Integer, nullable=False)
     status = Column(Enum(BookingStatus), nullable=False, default=BookingStatus.pending)  # تعديل هنا
     created_at = Column(DateTime, default=func.now(), nullable=False)
     updated_at = Column(DateTime, default=func.now(), onupdate=func.now(), nullable=False)
     client_secret = Column(String, nullable=True)
+    # مرجع يولد قبل إنشاء جلسة Stripe ويرسل في metadata (الحجوزات القديمة بدونه)
+    reference = Column(String(32), nullable=True)
+
+    # فهارس مركبة تطابق شكل الاستعلامات في app.py
+    __table_args__ = (
+        # السعة والتوفر وعدد حجوزات اليوم: restaurant_id + date (+ time + status)
+        Index("ix_bookings_slot", "restaurant_id", "date", "time", "status"),
+        # حجوزات المستخدم مرتبة حسب تاريخ الإنشاء
+        Index("ix_bookings_user_created", "user_id", "created_at"),
+        # انتهاء الحجوزات المؤقتة: status = pending و created_at قديم
+        Index("ix_bookings_status_created", "status", "created_at"),
+        # ربط جلسة الدفع بالحجز في webhook وصفحة النجاح
+        Index("ix_bookings_reference", "reference", unique=True),
+    )
 
     # الربط بالعلاقات
     user = relationship("User", back_populates="bookings")
+    # بدون JOIN تلقائي: استعلامات السعة والانتهاء لا تحتاج المطعم،
+    # ومن يحتاجه يحدد ذلك في استعلامه (joinedload)
     restaurant = relationship(
         "Restaurant",
         back_populates="bookings",
-        lazy="joined"
+        lazy="select"
     )
 
  # إعداد نموذج الرسائل في قاعدة 
@@ -88,3 +104,40 @@ class ContactMessage(Base):
     subject = Column(String(200), nullable=False)
     message = Column(Text, nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
+
+# -------------------------------
+# صندوق البريد الصادر: الرسائل تحفظ هنا ويرسلها عامل الخلفية (mailer.py)
+class EmailOutbox(Base):
+    __tablename__ = "email_outbox"
+
+    id = Column(Integer, primary_key=True)
+    to_email = Column(String(100), nullable=False)
+    subject = Column(String(200), nullable=False)
+    body = Column(Text, nullable=False)
+    status = Column(String(20), default="pending", nullable=False)  # pending / sent / failed
+    attempts = Column(Integer, default=0, nullable=False)
+    next_attempt_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    sent_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        # العامل يسحب الرسائل المستحقة فقط
+        Index("ix_email_outbox_due", "status", "next_attempt_at"),
+    )
+
+# -------------------------------
+# أحداث Stripe المستلمة: مفتاحها رقم الحدث حتى لا نعالج إعادة الإرسال مرتين
+class StripeEvent(Base):
+    __tablename__ = "stripe_events"
+
+    id = Column(String(255), primary_key=True)  # evt_...
+    type = Column(String(100), nullable=False)
+    booking_id = Column(Integer, nullable=True)
+    received_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    processed_at = Column(DateTime, nullable=True)  # فارغ = لم تكتمل المعالجة بعد
+    attempted_at = Column(DateTime, nullable=True)  # آخر إعادة محاولة: تحجز الحدث لعملية واحدة حتى المحاولة التالية
+
+    __table_args__ = (
+        Index("ix_stripe_events_processed", "processed_at"),
+    )
@@ -0,0 +1,47 @@
+# passwords.py - تشفير كلمات المرور بـ bcrypt خارج حلقة الأحداث
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+
+# معامل التكلفة (كل زيادة بواحد تضاعف الوقت تقريباً)
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# bcrypt يحرر الـ GIL أثناء الحساب، لذا تكفي مجموعة threads محدودة
+BCRYPT_WORKERS = int(os.getenv("BCRYPT_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+_executor = ThreadPoolExecutor(max_workers=BCRYPT_WORKERS, thread_name_prefix="bcrypt")
+
+
+# دالة لتشفير كلمة السر
+def hash_password(password: str) -> str:
+    salt = bcrypt.gensalt(rounds=BCRYPT_ROUNDS)
+    hashed = bcrypt.hashpw(password.encode('utf-8'), salt)
+    return hashed.decode('utf-8')
+
+
+# دالة للتحقق من كلمة السر
+def verify_password(plain_password: str, hashed_password: str) -> bool:
+    try:
+        return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
+    except ValueError:
+        # قيمة مخزنة ليست bcrypt صالحة
+        return False
+
+
+def needs_rehash(hashed_password: str) -> bool:
+    # الصيغة: $2b$12$<salt+hash> — الجزء الثالث هو معامل التكلفة
+    parts = hashed_password.split("$")
+    if len(parts) < 4 or not parts[2].isdigit():
+        return True
+    return int(parts[2]) != BCRYPT_ROUNDS
+
+
+async def hash_password_async(password: str) -> str:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, hash_password, password)
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, verify_password, plain_password, hashed_password)
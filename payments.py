@@ -0,0 +1,109 @@
+# payments.py - استدعاءات Stripe خارج حلقة الأحداث مع اتصال keep-alive ومهلة وإعادة محاولة
+import asyncio
+import contextvars
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import stripe
+from dotenv import load_dotenv
+
+from metrics import external_call
+
+load_dotenv()
+
+BASE_URL = os.getenv("BASE_URL")
+STRIPE_TIMEOUT = float(os.getenv("STRIPE_TIMEOUT", "10"))
+STRIPE_MAX_RETRIES = int(os.getenv("STRIPE_MAX_RETRIES", "2"))
+STRIPE_WORKERS = int(os.getenv("STRIPE_WORKERS", "8"))
+# لتوجيه الطلبات إلى خادم Stripe وهمي محلي (scripts/mock_stripe.py)
+STRIPE_API_BASE = os.getenv("STRIPE_API_BASE")
+
+stripe.api_key = os.getenv("STRIPE_SECRET_KEY")
+# Stripe يعيد المحاولة تلقائياً مع مفتاح idempotency لكل طلب
+stripe.max_network_retries = STRIPE_MAX_RETRIES
+# RequestsClient يحتفظ بـ requests.Session لكل thread، فتبقى اتصالات HTTPS مفتوحة بين الطلبات
+stripe.default_http_client = stripe.http_client.RequestsClient(timeout=STRIPE_TIMEOUT)
+if STRIPE_API_BASE:
+    stripe.api_base = STRIPE_API_BASE
+
+_executor = ThreadPoolExecutor(max_workers=STRIPE_WORKERS, thread_name_prefix="stripe")
+
+
+def create_booking_checkout(booking_ref: str, restaurant_name: str, booking_date: str, amount: int, customer_email: str):
+    with external_call("stripe"):
+        return _create_booking_checkout(booking_ref, restaurant_name, booking_date, amount, customer_email)
+
+
+def _create_booking_checkout(booking_ref: str, restaurant_name: str, booking_date: str, amount: int, customer_email: str):
+    # الجلسة تنشأ قبل حفظ الحجز، فتربط به عبر مرجعه (Booking.reference) وليس رقمه
+    return stripe.checkout.Session.create(
+        payment_method_types=['card'],
+        line_items=[{
+            'price_data': {
+                'currency': 'sar',
+                'product_data': {
+                    'name': f"حجز مطعم {restaurant_name} بتاريخ {booking_date}"
+                },
+                'unit_amount': amount
+            },
+            'quantity': 1
+        }],
+        mode='payment',
+        ui_mode='embedded',
+        metadata={"booking_ref": booking_ref},
+        return_url=f"{BASE_URL}/booking-success?session_id={{CHECKOUT_SESSION_ID}}",
+        customer_email=customer_email
+    )
+
+
+def expire_checkout_session(session_id: str):
+    # جلسة لم يعد لها حجز (فشل الحفظ أو رفض السعة): نغلقها حتى لا يمكن الدفع عبرها
+    try:
+        with external_call("stripe"):
+            stripe.checkout.Session.expire(session_id)
+    except stripe.error.StripeError as e:
+        print(f"⚠️ Failed to expire checkout session {session_id}: {e}")
+
+
+def checkout_session_id(client_secret: str):
+    # الحجز يحفظ client_secret فقط، وهو بصيغة Stripe: "<session id>_secret_<...>"
+    if not client_secret or "_secret_" not in client_secret:
+        return None
+    return client_secret.split("_secret_", 1)[0]
+
+
+def expire_checkout_sessions(session_ids):
+    # جلسات حجوزات انتهت مهلتها: على threads الـ executor بدل انتظار Stripe لكل جلسة بالتتابع
+    list(_executor.map(lambda session_id: expire_checkout_session(session_id), session_ids))
+
+
+def refund_checkout_session(session_id: str):
+    """
+    استرداد دفعة جلسة لم يعد لحجزها مكان. مفتاح idempotency ثابت لكل جلسة، فتكرار الاستدعاء
+    (الـ webhook وصفحة النجاح وإعادة المعالجة) لا ينشئ أكثر من استرداد واحد.
+    """
+    with external_call("stripe"):
+        session = stripe.checkout.Session.retrieve(session_id)
+        if not session.payment_intent:
+            return None
+        return stripe.Refund.create(payment_intent=session.payment_intent, idempotency_key=f"refund-{session_id}")
+
+
+async def _run_async(fn, **kwargs):
+    loop = asyncio.get_running_loop()
+    # run_in_executor لا ينقل الـ contextvars، فننقلها يدوياً حتى يحسب زمن Stripe للطلب الحالي
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(_executor, lambda: context.run(fn, **kwargs))
+
+
+async def create_booking_checkout_async(**kwargs):
+    return await _run_async(create_booking_checkout, **kwargs)
+
+
+async def expire_checkout_session_async(session_id: str):
+    await _run_async(expire_checkout_session, session_id=session_id)
+
+
+def retrieve_checkout_session(session_id: str):
+    with external_call("stripe"):
+        return stripe.checkout.Session.retrieve(session_id)
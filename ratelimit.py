@@ -0,0 +1,47 @@
+# ratelimit.py - حدود الطلبات (slowapi) بتخزين مشترك بين كل عمليات uvicorn
+#
+# التخزين في الذاكرة يعني أن "5/minute" تصبح 5×N مع N عمليات، وتضيع العدادات عند إعادة التشغيل.
+# مع RATE_LIMIT_STORAGE_URI=redis://... (أو أي خادم متوافق مع Redis) تتشارك العمليات نفس العدادات؛
+# مكتبة limits تنفذ فحص كل حد بسكربت Lua واحد (ذهاب وإياب واحد للخادم).
+# إذا تعطل Redis نرجع مؤقتاً لعدادات في الذاكرة بدل رفض الطلبات أو تعطيل الحدود.
+import os
+
+from dotenv import load_dotenv
+from limits.strategies import STRATEGIES
+from slowapi import Limiter
+from slowapi.util import get_remote_address
+
+load_dotenv()
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "1") == "1"
+RATE_LIMIT_STORAGE_URI = os.getenv("RATE_LIMIT_STORAGE_URI", "memory://")
+# نافذة منزلقة بعدادين (الحالية والسابقة): بدون قفزة الضعف عند حد النافذة الثابتة
+# وبتكلفة ثابتة لكل مفتاح (moving-window تحفظ وقت كل طلب). الإصدارات القديمة من limits لا تدعمها.
+RATE_LIMIT_STRATEGY = os.getenv(
+    "RATE_LIMIT_STRATEGY",
+    "sliding-window-counter" if "sliding-window-counter" in STRATEGIES else "moving-window"
+)
+RATE_LIMIT_KEY_PREFIX = os.getenv("RATE_LIMIT_KEY_PREFIX", "table-res")
+
+# حدود كل مسار (صيغة limits: "10/minute" أو "5/minute;100/day")
+LOGIN_LIMIT = os.getenv("LOGIN_RATE_LIMIT", "5/minute")
+REGISTER_LIMIT = os.getenv("REGISTER_RATE_LIMIT", "10/hour")
+BOOKING_LIMIT = os.getenv("BOOKING_RATE_LIMIT", "10/minute")
+AVAILABILITY_LIMIT = os.getenv("AVAILABILITY_RATE_LIMIT", "60/minute")
+
+
+def create_limiter(storage_uri: str = RATE_LIMIT_STORAGE_URI, strategy: str = RATE_LIMIT_STRATEGY,
+                   enabled: bool = RATE_LIMIT_ENABLED) -> Limiter:
+    shared = not storage_uri.startswith("memory://")
+    return Limiter(
+        key_func=get_remote_address,
+        storage_uri=storage_uri,
+        strategy=strategy,
+        key_prefix=RATE_LIMIT_KEY_PREFIX,
+        # الرجوع للذاكرة له معنى فقط مع تخزين خارجي
+        in_memory_fallback_enabled=shared,
+        enabled=enabled,
+    )
+
+
+limiter = create_limiter()
@@ -0,0 +1,81 @@
+# scripts/build_assets.py - بناء ملفات static ببصمة محتوى مع نسخ gzip و brotli
+#
+# التشغيل من جذر المشروع (قبل تشغيل التطبيق أو عند كل نشر):
+#   python -m scripts.build_assets
+#
+# يكتب static/dist/<المسار>.<hash>.<الامتداد> و .gz و .br (إذا كانت مكتبة brotli مثبتة)
+# ثم static/dist/manifest.json الذي تستخدمه asset_url في القوالب.
+import gzip
+import hashlib
+import json
+import os
+import shutil
+
+from assets import STATIC_DIR, DIST_DIR, MANIFEST_PATH
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# ملفات نصية تستفيد من الضغط (الصور المضغوطة أصلاً لا تستفيد)
+COMPRESSIBLE = {".css", ".js", ".svg", ".json", ".html", ".txt"}
+HASH_LENGTH = 10
+
+
+def source_files():
+    for root, dirs, files in os.walk(STATIC_DIR):
+        # لا نعيد بناء مخرجات البناء السابق
+        dirs[:] = [d for d in dirs if os.path.join(root, d) != os.path.join(STATIC_DIR, DIST_DIR)]
+        for name in sorted(files):
+            full_path = os.path.join(root, name)
+            yield os.path.relpath(full_path, STATIC_DIR).replace(os.sep, "/"), full_path
+
+
+def build():
+    dist = os.path.join(STATIC_DIR, DIST_DIR)
+    shutil.rmtree(dist, ignore_errors=True)
+
+    manifest = {}
+    original_total = gzip_total = brotli_total = 0
+    for asset, full_path in source_files():
+        with open(full_path, "rb") as f:
+            content = f.read()
+
+        digest = hashlib.sha256(content).hexdigest()[:HASH_LENGTH]
+        stem, ext = os.path.splitext(asset)
+        hashed = f"{DIST_DIR}/{stem}.{digest}{ext}"
+        target = os.path.join(STATIC_DIR, hashed)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target, "wb") as f:
+            f.write(content)
+
+        line = f"{asset:<20} {len(content):>8} B"
+        original_total += len(content)
+        if ext in COMPRESSIBLE:
+            # mtime=0 حتى يكون الناتج نفسه في كل بناء
+            gzipped = gzip.compress(content, compresslevel=9, mtime=0)
+            with open(target + ".gz", "wb") as f:
+                f.write(gzipped)
+            gzip_total += len(gzipped)
+            line += f"  gzip {len(gzipped):>7} B"
+
+            if brotli is not None:
+                compressed = brotli.compress(content, quality=11)
+                with open(target + ".br", "wb") as f:
+                    f.write(compressed)
+                brotli_total += len(compressed)
+                line += f"  br {len(compressed):>7} B"
+
+        manifest[asset] = hashed
+        print(f"{line}  -> {hashed}")
+
+    with open(MANIFEST_PATH, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+
+    print(f"{len(manifest)} assets, {original_total} B -> gzip {gzip_total} B"
+          + (f", br {brotli_total} B" if brotli is not None else " (brotli not installed, .br skipped)"))
+
+
+if __name__ == "__main__":
+    build()
@@ -0,0 +1,169 @@
+# scripts/check_query_counts.py - عدّ استعلامات SQL في المسارات الساخنة
+#
+# التشغيل من جذر المشروع:
+#   python -m scripts.check_query_counts
+#
+# يعمل دائماً على SQLite مؤقت (عدد الاستعلامات لا يتعلق بنوع قاعدة البيانات).
+# يخرج بالرمز 1 إذا زاد عدد الاستعلامات عن المتوقع، أو إذا ظهر جدول المطاعم
+# في مسارات السعة والانتهاء التي يجب ألا تحمل المطعم.
+# مسارات إنشاء وتعديل وإلغاء الحجز تعد عبر دوال الاستعلام التي تستخدمها (بدون Stripe والجلسة).
+import asyncio
+import os
+import re
+import sys
+from datetime import date, datetime, time, timedelta
+
+DB_FILE = "bench_query_counts.db"
+os.environ["DATABASE_URL"] = f"sqlite:///{DB_FILE}"
+os.environ["ASYNC_DATABASE_URL"] = f"sqlite+aiosqlite:///{DB_FILE}"
+os.environ["EMAIL_WORKER"] = "0"
+
+from sqlalchemy import event
+
+from db import AsyncSessionLocal, Base, SessionLocal, async_engine, engine
+from models import Booking, BookingStatus, Restaurant, User
+from capacity import ledger
+from expiry import HoldTimer, sweep_expired_bookings
+from serializers import user_booking_serializer
+from emails import send_booking_cancellation
+from app import (
+    admin_bookings_chunk, user_booking_summary, user_bookings_page,
+    booking_restaurant_query, admit_booking, restaurant_hours, move_booking, cancel_user_booking, restaurant_name
+)
+
+RESTAURANTS = re.compile(r"\brestaurants\b", re.IGNORECASE)
+
+
+class StatementCounter:
+    def __init__(self, target=engine):
+        self.target = target
+        self.statements = []
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    def __enter__(self):
+        event.listen(self.target, "before_cursor_execute", self._record)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.target, "before_cursor_execute", self._record)
+
+
+def seed():
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        restaurants = [
+            Restaurant(
+                name=f"مطعم {i}", name_en=f"Restaurant {i}", area="الرياض", cuisine="بحري",
+                opens_at=time(9, 0), closes_at=time(23, 0), capacity=40
+            ) for i in range(3)
+        ]
+        user = User(fullname="Query Count", email="counts@check.local", password="x")
+        db.add_all(restaurants + [user])
+        db.flush()
+
+        old = datetime.now() - timedelta(hours=1)
+        for i in range(30):
+            db.add(Booking(
+                restaurant_id=restaurants[i % 3].id, user_id=user.id,
+                date=date.today() + timedelta(days=i % 5), time=time(19, 0), people=2,
+                # كل ثالث حجز مؤقت قديم حتى تجد دورة الانتهاء ما تلغيه
+                status=BookingStatus.pending if i % 3 == 0 else BookingStatus.confirmed,
+                created_at=old + timedelta(seconds=i)
+            ))
+        db.commit()
+        return user.id, restaurants[0].id
+    finally:
+        db.close()
+
+
+def check(name, fn, max_statements, restaurants_allowed=False, target=engine):
+    with StatementCounter(target) as counter:
+        fn()
+    statements = counter.statements
+    touches_restaurants = any(RESTAURANTS.search(s) for s in statements)
+
+    ok = len(statements) <= max_statements and (restaurants_allowed or not touches_restaurants)
+    print(f"{'OK  ' if ok else 'FAIL'} {name}: {len(statements)} statements (max {max_statements})"
+          f"{' + restaurants' if touches_restaurants else ''}")
+    if not ok:
+        for s in statements:
+            print("     ", " ".join(s.split()))
+    return ok
+
+
+def main():
+    user_id, restaurant_id = seed()
+    db = SessionLocal()
+    results = []
+    try:
+        def load_booking():
+            booking = db.query(Booking).filter(Booking.user_id == user_id).first()
+            return booking.people, booking.status
+
+        def user_page():
+            bookings, _ = user_bookings_page(db, user_id, None, 20)
+            serialize = user_booking_serializer("ar")
+            return [serialize(b) for b in bookings]
+
+        def admin_page():
+            return admin_bookings_chunk(db, "en", None, 50)
+
+        async def create_path():
+            # مسار إنشاء الحجز بدون Stripe: أعمدة المطعم، ثم القفل والمجموع والإدراج في معاملة واحدة
+            async with AsyncSessionLocal() as session:
+                restaurant = (await session.execute(booking_restaurant_query(restaurant_id))).first()
+                booking = Booking(
+                    restaurant_id=restaurant.id, user_id=user_id, date=date.today() + timedelta(days=10),
+                    time=time(20, 0), people=2, status=BookingStatus.pending
+                )
+                admitted, _, _ = await admit_booking(session, booking)
+                assert admitted
+
+        def update_path():
+            booking = db.query(Booking).filter(Booking.user_id == user_id, Booking.status == BookingStatus.confirmed).first()
+            restaurant_hours(db, booking.restaurant_id)
+            assert move_booking(db, booking, booking.date + timedelta(days=1), time(21, 0), 2)
+
+        def cancel_path():
+            booking = db.query(Booking).filter(Booking.user_id == user_id, Booking.status == BookingStatus.confirmed).first()
+            service_name = restaurant_name(db, booking.restaurant_id)
+            send_booking_cancellation("Query Count", "counts@check.local", booking.id, booking.date, booking.time,
+                                      service_name, db=db)
+            cancel_user_booking(db, booking)
+
+        # تحميل حجز واحد: بدون JOIN على المطاعم
+        results.append(check("Booking load", load_booking, 1))
+        # السعة: استعلام تجميعي واحد
+        results.append(check("ledger.rebuild", lambda: ledger.rebuild(db), 1))
+        results.append(check("HoldTimer.rebuild", lambda: HoldTimer().rebuild(db), 1))
+        # دورة الانتهاء: SELECT + UPDATE + إعادة قراءة فترات الدفعة للسجل (بدون أي تحميل للمطاعم)
+        results.append(check("sweep_expired_bookings", sweep_expired_bookings, 3))
+        # صفحة حجوزات المستخدم مع اسم المطعم: استعلام واحد بدون N+1
+        results.append(check("user_bookings_page", user_page, 1, restaurants_allowed=True))
+        results.append(check("user_booking_summary", lambda: user_booking_summary(db, user_id), 1))
+        results.append(check("admin_bookings_chunk", admin_page, 1, restaurants_allowed=True))
+        # مسارات الحجز: المطعم بأعمدته فقط وقفل صفه، بدون تحميل كائن المطعم أو الحجوزات
+        # (على SQLite يسبق القفل UPDATE لا يغير شيئاً لأخذ قفل الكتابة: استعلام إضافي لا يوجد في MySQL)
+        # أعمدة المطعم + قفل الكتابة + قفل + مجموع + INSERT
+        results.append(check("create_booking", lambda: asyncio.run(create_path()), 5,
+                             restaurants_allowed=True, target=async_engine.sync_engine))
+        # تحميل الحجز + ساعات العمل + قفل الكتابة + قفل + مجموع + UPDATE + إعادة قراءة الفترتين
+        results.append(check("update_booking", update_path, 7, restaurants_allowed=True))
+        # تحميل الحجز + اسم المطعم + INSERT الإيميل و UPDATE في نفس المعاملة + إعادة قراءة الفترة
+        results.append(check("cancel_booking", cancel_path, 5, restaurants_allowed=True))
+    finally:
+        db.close()
+        engine.dispose()
+        asyncio.run(async_engine.dispose())
+        os.remove(DB_FILE)
+
+    if not all(results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
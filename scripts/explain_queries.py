@@ -0,0 +1,85 @@
+# scripts/explain_queries.py - التحقق عبر EXPLAIN من أن استعلامات الحجوزات تستخدم فهرساً
+#
+# التشغيل من جذر المشروع:
+#   python -m scripts.explain_queries
+# يخرج بالرمز 1 إذا كان أي استعلام يمسح جدول الحجوزات كاملاً.
+import sys
+from datetime import date, time, timedelta
+
+from sqlalchemy import event, func
+
+from db import SessionLocal, engine
+from models import Booking, Restaurant
+from capacity import HELD_STATUSES, held_people_query
+
+
+@event.listens_for(engine, "before_cursor_execute", retval=True)
+def _prefix_explain(conn, cursor, statement, parameters, context, executemany):
+    if conn.get_execution_options().get("explain"):
+        prefix = "EXPLAIN QUERY PLAN " if conn.dialect.name == "sqlite" else "EXPLAIN "
+        statement = prefix + statement
+    return statement, parameters
+
+
+def query_shapes(db):
+    today = date.today()
+    return {
+        # create_booking / update_booking: نفس استعلام القبول الذي ينفذه التطبيق (مجموع الأشخاص في فترة واحدة)
+        "create_booking": held_people_query(1, today, time(19, 0)),
+        "update_booking": held_people_query(1, today, time(19, 0), exclude_booking_id=1),
+        # check_availability: مجموع الفترات لمدى من الأيام
+        "check_availability": db.query(Booking.date, Booking.time, func.sum(Booking.people)).filter(
+            Booking.restaurant_id == 1,
+            Booking.date.between(today, today + timedelta(days=7)),
+            Booking.status.in_(HELD_STATUSES)
+        ).group_by(Booking.date, Booking.time),
+        # get_restaurants: عدد حجوزات اليوم لكل مطعم
+        "get_restaurants": db.query(Restaurant.id, func.count(Booking.id)).outerjoin(
+            Booking,
+            (Booking.restaurant_id == Restaurant.id) & (Booking.date == today)
+        ).group_by(Restaurant.id),
+        # list_user_bookings: حجوزات المستخدم الأحدث أولاً
+        "list_user_bookings": db.query(Booking.id).filter(
+            Booking.user_id == 1
+        ).order_by(Booking.created_at.desc()),
+    }
+
+
+def bookings_plan_ok(dialect: str, rows, keys) -> bool:
+    if dialect == "sqlite":
+        details = [r[-1] for r in rows if "bookings" in r[-1]]
+        return bool(details) and all("USING" in d and "INDEX" in d for d in details)
+
+    # MySQL: كل صف يخص جدول الحجوزات يجب أن يكون له key
+    table_col = keys.index("table")
+    key_col = keys.index("key")
+    booking_rows = [r for r in rows if r[table_col] == "bookings"]
+    return bool(booking_rows) and all(r[key_col] for r in booking_rows)
+
+
+def main():
+    db = SessionLocal()
+    failed = []
+    try:
+        conn = db.connection(execution_options={"explain": True})
+        for name, query in query_shapes(db).items():
+            # استعلامات ORM و select جاهزة من capacity.py
+            result = conn.execute(getattr(query, "statement", query))
+            keys = [d[0] for d in result.cursor.description]
+            rows = result.cursor.fetchall()
+            ok = bookings_plan_ok(conn.dialect.name, rows, keys)
+            print(f"{'OK  ' if ok else 'FAIL'} {name}")
+            for row in rows:
+                print("     ", row)
+            if not ok:
+                failed.append(name)
+    finally:
+        db.close()
+
+    if failed:
+        print(f"queries without an index on bookings: {', '.join(failed)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+# scripts/migrate_bookings.py - ترحيل جدول الحجوزات إلى عمود DATE وإضافة الأعمدة الجديدة والفهارس المركبة
+#
+# التشغيل من جذر المشروع:
+#   python -m scripts.migrate_bookings          # تنفيذ
+#   python -m scripts.migrate_bookings --dry    # عرض الخطوات فقط
+import sys
+
+from sqlalchemy import inspect, text
+
+from db import engine
+from models import Base, Booking, StripeEvent
+
+
+def migrate_date_column(conn, dry: bool):
+    columns = {c["name"]: c for c in inspect(conn).get_columns("bookings")}
+    current = str(columns["date"]["type"]).upper()
+    if current == "DATE":
+        print("bookings.date: already DATE")
+        return
+
+    if conn.dialect.name != "mysql":
+        # SQLite لا يدعم تعديل نوع العمود، والقيم المخزنة تعمل مع Date كما هي
+        print(f"bookings.date: {current} on {conn.dialect.name}, skipped")
+        return
+
+    # كل القيم المخزنة تاريخ عند منتصف الليل، فالتحويل لا يفقد بيانات
+    sql = "ALTER TABLE bookings MODIFY COLUMN `date` DATE NOT NULL"
+    print(sql)
+    if not dry:
+        conn.execute(text(sql))
+
+
+def add_reference_column(conn, dry: bool):
+    columns = {c["name"] for c in inspect(conn).get_columns("bookings")}
+    if "reference" in columns:
+        print("bookings.reference: exists")
+        return
+
+    # عمود فارغ للحجوزات القديمة (جلساتها تحمل booking_id في metadata)
+    sql = "ALTER TABLE bookings ADD COLUMN reference VARCHAR(32) NULL"
+    print(sql)
+    if not dry:
+        conn.execute(text(sql))
+
+
+def add_attempted_at_column(conn, dry: bool):
+    if not inspect(conn).has_table(StripeEvent.__tablename__):
+        return
+    columns = {c["name"] for c in inspect(conn).get_columns(StripeEvent.__tablename__)}
+    if "attempted_at" in columns:
+        print("stripe_events.attempted_at: exists")
+        return
+
+    sql = "ALTER TABLE stripe_events ADD COLUMN attempted_at DATETIME NULL"
+    print(sql)
+    if not dry:
+        conn.execute(text(sql))
+
+
+def create_indexes(conn, dry: bool):
+    # الفهارس المعرفة في models.py هي المصدر الوحيد
+    for table in Base.metadata.sorted_tables:
+        existing = {i["name"] for i in inspect(conn).get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name in existing:
+                print(f"{index.name}: exists")
+                continue
+            print(f"CREATE INDEX {index.name} ON {table.name} ({', '.join(c.name for c in index.columns)})")
+            if not dry:
+                index.create(conn)
+
+
+def main():
+    dry = "--dry" in sys.argv
+    with engine.begin() as conn:
+        if not inspect(conn).has_table(Booking.__tablename__):
+            print("bookings table does not exist; run the app once to create the schema")
+            return
+        migrate_date_column(conn, dry)
+        add_reference_column(conn, dry)
+        add_attempted_at_column(conn, dry)
+        create_indexes(conn, dry)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+# scripts/mock_stripe.py - خادم Stripe وهمي محلي لقياس أداء إنشاء الحجز بدون الاتصال بـ Stripe
+#
+# التشغيل من جذر المشروع:
+#   python -m scripts.mock_stripe --port 12111 --latency-ms 300
+# ثم تشغيل التطبيق مع:
+#   STRIPE_API_BASE=http://127.0.0.1:12111 STRIPE_SECRET_KEY=sk_test_mock
+#
+# يدعم فقط ما يستخدمه التطبيق: إنشاء واسترجاع وإنهاء (expire) checkout session.
+import argparse
+import json
+import secrets
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl
+
+sessions = {}
+sessions_lock = threading.Lock()
+
+
+class MockStripeHandler(BaseHTTPRequestHandler):
+    latency = 0.0
+    protocol_version = "HTTP/1.1"  # keep-alive مثل Stripe الحقيقي
+
+    def _send(self, status: int, payload: dict):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Request-Id", f"req_{secrets.token_hex(8)}")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        form = dict(parse_qsl(self.rfile.read(length).decode()))
+        time.sleep(self.latency)
+
+        if self.path.startswith("/v1/checkout/sessions/") and self.path.endswith("/expire"):
+            session_id = self.path[len("/v1/checkout/sessions/"):-len("/expire")]
+            with sessions_lock:
+                session = sessions.get(session_id)
+                if session:
+                    session["status"] = "expired"
+            if not session:
+                self._send(404, {"error": {"type": "invalid_request_error", "message": "No such checkout.session"}})
+                return
+            self._send(200, session)
+            return
+
+        if self.path != "/v1/checkout/sessions":
+            self._send(404, {"error": {"type": "invalid_request_error", "message": "Unrecognized request URL"}})
+            return
+
+        session_id = f"cs_test_{secrets.token_hex(12)}"
+        session = {
+            "id": session_id,
+            "object": "checkout.session",
+            "client_secret": f"{session_id}_secret_{secrets.token_hex(8)}",
+            "customer_email": form.get("customer_email"),
+            "metadata": {
+                key[len("metadata["):-1]: value
+                for key, value in form.items() if key.startswith("metadata[")
+            },
+            "mode": form.get("mode"),
+            "ui_mode": form.get("ui_mode"),
+            "status": "open",
+        }
+        with sessions_lock:
+            sessions[session_id] = session
+        self._send(200, session)
+
+    def do_GET(self):
+        time.sleep(self.latency)
+        prefix = "/v1/checkout/sessions/"
+        session_id = self.path[len(prefix):].split("?")[0] if self.path.startswith(prefix) else None
+        with sessions_lock:
+            session = sessions.get(session_id)
+        if not session:
+            self._send(404, {"error": {"type": "invalid_request_error", "message": "No such checkout.session"}})
+            return
+        self._send(200, session)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=12111)
+    parser.add_argument("--latency-ms", type=float, default=300)
+    args = parser.parse_args()
+
+    MockStripeHandler.latency = args.latency_ms / 1000
+    server = ThreadingHTTPServer((args.host, args.port), MockStripeHandler)
+    print(f"Mock Stripe listening on http://{args.host}:{args.port} (latency {args.latency_ms:.0f}ms)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+# scripts/smtp_sink.py - خادم SMTP محلي (aiosmtpd) يطبع الرسائل بدل إرسالها
+#
+# التشغيل من جذر المشروع:
+#   python -m scripts.smtp_sink            # يستمع على localhost:1025
+#   SMTP_SINK_FAIL_EVERY=3 python -m scripts.smtp_sink   # يرفض كل ثالث رسالة لتجربة إعادة المحاولة
+import os
+import time
+
+from aiosmtpd.controller import Controller
+
+HOST = os.getenv("SMTP_SINK_HOST", "localhost")
+PORT = int(os.getenv("SMTP_SINK_PORT", "1025"))
+FAIL_EVERY = int(os.getenv("SMTP_SINK_FAIL_EVERY", "0"))
+
+
+class PrintingHandler:
+    def __init__(self):
+        self.received = 0
+
+    async def handle_DATA(self, server, session, envelope):
+        self.received += 1
+        if FAIL_EVERY and self.received % FAIL_EVERY == 0:
+            print(f"[{self.received}] rejected {envelope.rcpt_tos}")
+            return "451 Temporary failure, try again later"
+
+        print(f"[{self.received}] {envelope.mail_from} -> {envelope.rcpt_tos} ({len(envelope.content)} bytes)")
+        return "250 Message accepted for delivery"
+
+
+if __name__ == "__main__":
+    controller = Controller(PrintingHandler(), hostname=HOST, port=PORT)
+    controller.start()
+    print(f"SMTP sink listening on {HOST}:{PORT}")
+    try:
+        while True:
+            time.sleep(60)
+    except KeyboardInterrupt:
+        controller.stop()
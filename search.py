@@ -0,0 +1,152 @@
+# search.py - فهرس بحث في الذاكرة للمطاعم (عربي/إنجليزي) مع ترتيب وتسامح مع الأخطاء الإملائية
+import re
+import threading
+from collections import defaultdict
+
+from rapidfuzz import fuzz
+
+from models import Restaurant
+
+# الحقول المفهرسة ووزن كل حقل في الترتيب (الاسم أهم من المنطقة ونوع المطبخ)
+FIELD_WEIGHTS = {
+    "name": 1.0,
+    "name_en": 1.0,
+    "cuisine": 0.85,
+    "cuisine_en": 0.85,
+    "area": 0.8,
+    "area_en": 0.8,
+}
+# أقل درجة (من 100) لاعتبار المطعم مطابقاً
+MIN_SCORE = 70
+# نسبة الـ trigrams المشتركة المطلوبة لاعتبار المطعم مرشحاً
+MIN_TRIGRAM_OVERLAP = 0.3
+
+_TASHKEEL = re.compile(r"[\u0610-\u061A\u064B-\u065F\u0670\u0640]")
+_SPLIT = re.compile(r"[^\w]+")
+
+
+# 🔹 دالة لتوحيد النصوص وإزالة الهمزات
+def normalize_text(text: str):
+    return (
+        _TASHKEEL.sub("", text or "")
+        .replace("أ", "ا")
+        .replace("إ", "ا")
+        .replace("آ", "ا")
+        .replace("ة", "ه")
+        .replace("ى", "ي")
+        .lower()
+        .strip()
+    )
+
+
+def tokenize(text: str):
+    return [t for t in _SPLIT.split(normalize_text(text)) if t]
+
+
+def trigrams(token: str):
+    padded = f" {token} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class RestaurantSearchIndex:
+    def __init__(self):
+        self._docs = {}                       # id -> {field: normalized text}
+        self._tokens = defaultdict(set)       # token -> ids
+        self._trigrams = defaultdict(set)     # trigram -> ids
+        self._lock = threading.Lock()
+        # حالة الكتالوج (عدد المطاعم، آخر updated_at) عند آخر بناء
+        self.state = None
+
+    def build(self, db, state: tuple = None):
+        restaurants = db.query(
+            Restaurant.id,
+            *(getattr(Restaurant, field) for field in FIELD_WEIGHTS)
+        ).all()
+
+        with self._lock:
+            self._docs.clear()
+            self._tokens.clear()
+            self._trigrams.clear()
+            for r in restaurants:
+                self._add(r.id, {field: getattr(r, field) for field in FIELD_WEIGHTS})
+            self.state = state
+        return len(restaurants)
+
+    def upsert(self, restaurant: Restaurant):
+        fields = {field: getattr(restaurant, field) for field in FIELD_WEIGHTS}
+        with self._lock:
+            self._remove(restaurant.id)
+            self._add(restaurant.id, fields)
+
+    def remove(self, restaurant_id: int):
+        with self._lock:
+            self._remove(restaurant_id)
+
+    def _add(self, restaurant_id: int, fields: dict):
+        doc = {field: normalize_text(value) for field, value in fields.items() if value}
+        self._docs[restaurant_id] = doc
+        for text in doc.values():
+            for token in tokenize(text):
+                self._tokens[token].add(restaurant_id)
+                for gram in trigrams(token):
+                    self._trigrams[gram].add(restaurant_id)
+
+    def _remove(self, restaurant_id: int):
+        doc = self._docs.pop(restaurant_id, None)
+        if not doc:
+            return
+        for text in doc.values():
+            for token in tokenize(text):
+                self._tokens[token].discard(restaurant_id)
+                if not self._tokens[token]:
+                    del self._tokens[token]
+                for gram in trigrams(token):
+                    self._trigrams[gram].discard(restaurant_id)
+                    if not self._trigrams[gram]:
+                        del self._trigrams[gram]
+
+    def _candidates(self, query_tokens):
+        candidates = set()
+        for token in query_tokens:
+            # تطابق تام أو بادئة (البحث أثناء الكتابة)
+            candidates |= self._tokens.get(token, set())
+            if len(token) >= 2:
+                for indexed, ids in self._tokens.items():
+                    if indexed.startswith(token):
+                        candidates |= ids
+
+            # تطابق تقريبي عبر الـ trigrams المشتركة
+            grams = trigrams(token)
+            counts = defaultdict(int)
+            for gram in grams:
+                for restaurant_id in self._trigrams.get(gram, ()):
+                    counts[restaurant_id] += 1
+            needed = max(1, int(len(grams) * MIN_TRIGRAM_OVERLAP))
+            candidates |= {rid for rid, count in counts.items() if count >= needed}
+        return candidates
+
+    def search(self, text: str, limit: int = None):
+        """
+        يرجع قائمة (id, score) مرتبة من الأعلى تطابقاً.
+        """
+        query = normalize_text(text)
+        query_tokens = tokenize(query)
+        if not query_tokens:
+            return []
+
+        with self._lock:
+            results = []
+            for restaurant_id in self._candidates(query_tokens):
+                doc = self._docs[restaurant_id]
+                score = max(
+                    fuzz.WRatio(query, value) * FIELD_WEIGHTS[field]
+                    for field, value in doc.items()
+                )
+                if score >= MIN_SCORE:
+                    results.append((restaurant_id, score))
+
+        results.sort(key=lambda item: (-item[1], item[0]))
+        return results[:limit] if limit else results
+
+
+search_index = RestaurantSearchIndex()
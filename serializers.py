@@ -0,0 +1,116 @@
+# serializers.py - تحويل المطاعم والحجوزات إلى JSON (bytes) مباشرة عبر orjson
+#
+# الدوال مجهزة مسبقاً لكل لغة (بدون تفرع lang == "ar" لكل حقل في كل صف)،
+# والتواريخ والـ Enum يحولها orjson بنفسه، فلا حاجة لـ jsonable_encoder في FastAPI.
+from operator import attrgetter
+
+import orjson
+from fastapi.responses import Response
+
+from models import BookingStatus
+
+UNKNOWN = "غير معروف"
+
+
+def hhmm(value) -> str:
+    # أسرع من strftime("%H:%M")
+    return value.isoformat(timespec="minutes")
+
+
+def dumps(payload) -> bytes:
+    return orjson.dumps(payload)
+
+
+def json_response(body: bytes, status_code: int = 200, headers: dict = None) -> Response:
+    # body جاهز مسبقاً (مثلاً من الكاش)
+    return Response(content=body, status_code=status_code, headers=headers, media_type="application/json")
+
+
+def ok_response(**payload) -> Response:
+    return json_response(dumps({"status": "success", **payload}))
+
+
+def _lang_key(lang: str) -> str:
+    # نفس سلوك الـ endpoints: أي لغة غير العربية تعني الإنجليزية مع الرجوع للعربي
+    return "ar" if lang == "ar" else "en"
+
+
+def _localized(lang: str, field: str):
+    arabic = attrgetter(field)
+    if lang == "ar":
+        return arabic
+    english = attrgetter(f"{field}_en")
+    return lambda obj: english(obj) or arabic(obj)
+
+
+def _restaurant_serializer(lang: str):
+    name, area, cuisine = (_localized(lang, field) for field in ("name", "area", "cuisine"))
+
+    def serialize(r) -> dict:
+        return {
+            "id": r.id,
+            "name": name(r),
+            "area": area(r),
+            "cuisine": cuisine(r),
+            "opens_at": hhmm(r.opens_at),
+            "closes_at": hhmm(r.closes_at),
+            "capacity": r.capacity,
+            "created_at": r.created_at,
+            "updated_at": r.updated_at
+        }
+    return serialize
+
+
+def _user_booking_serializer(lang: str):
+    restaurant_name = _localized(lang, "name")
+
+    def serialize(b) -> dict:
+        data = {
+            "id": b.id,
+            "restaurant_name": restaurant_name(b.restaurant) if b.restaurant else UNKNOWN,
+            "date": b.date,
+            "time": hhmm(b.time),
+            "people": b.people,
+            "status": b.status,
+            "created_at": b.created_at,
+            "updated_at": b.updated_at
+        }
+        # الحجز Pending: نرسل client_secret لتمكين زر "ادفع الآن"
+        if b.status == BookingStatus.pending:
+            data["client_secret"] = b.client_secret
+        return data
+    return serialize
+
+
+def _admin_booking_serializer(lang: str):
+    restaurant_name = _localized(lang, "name")
+
+    def serialize(r) -> dict:
+        # r صف أعمدة (id, name, name_en, fullname, date, time, people, status)
+        return {
+            "id": r.id,
+            "restaurant_name": restaurant_name(r),
+            "user_name": r.fullname or UNKNOWN,
+            "date": r.date,
+            "time": hhmm(r.time),
+            "people": r.people,
+            "status": r.status.value,
+        }
+    return serialize
+
+
+_RESTAURANT = {lang: _restaurant_serializer(lang) for lang in ("ar", "en")}
+_USER_BOOKING = {lang: _user_booking_serializer(lang) for lang in ("ar", "en")}
+_ADMIN_BOOKING = {lang: _admin_booking_serializer(lang) for lang in ("ar", "en")}
+
+
+def restaurant_serializer(lang: str):
+    return _RESTAURANT[_lang_key(lang)]
+
+
+def user_booking_serializer(lang: str):
+    return _USER_BOOKING[_lang_key(lang)]
+
+
+def admin_booking_serializer(lang: str):
+    return _ADMIN_BOOKING[_lang_key(lang)]